@@ -27,6 +27,8 @@ import json
 import datetime
 import CyberiadaML
 
+from data import program_fingerprint
+
 DEFAULT_PROGRAMS_DIR = 'default_arena_programs'
 ROSTERS_DIR = 'arena-rosters'
 PROGRAMS_DIR = 'arena-programs'
@@ -99,19 +101,18 @@ def load_default_programs():
     for u in UNITS:
          prg = load_program_path(DEFAULT_PROGRAMS_DIR, u)
          programs[u] = prg
-         program_hashes[hash(str(prg))] = u
+         program_hashes[program_fingerprint(str(prg))] = u
     return programs, program_hashes
 
 def load_program(graph_dir, graph_id, unit, default_hashes):
     program = load_program_path(graph_dir, graph_id)
     if program is None:
         return None, None
-    pstr = str(program)
-    phash = hash(pstr)
+    phash = program_fingerprint(str(program))
     if phash in default_hashes:
         return 'def', default_hashes[phash]
     else:
-        return pstr, program
+        return phash, program
 
 def read_roster_files(asset, player_id, default_hashes = {}, uniq_programs = {}):
     the_roster = {}
@@ -130,24 +131,24 @@ def read_roster_files(asset, player_id, default_hashes = {}, uniq_programs = {})
                 if dtype not in UNITS:
                     error('Bad roster JSON {}: unknown drone type {}'.format(filepath, dtype))
                 graph = d['GraphID']
-                program_string, program = load_program(asset_dir, graph, dtype, default_hashes)
+                phash, program = load_program(asset_dir, graph, dtype, default_hashes)
                 u = { 'type': dtype }
-                if program_string is None:
+                if phash is None:
                     u['default'] = False
                     u['broken'] = True
-                elif program_string == 'def':
+                elif phash == 'def':
                     u['default'] = True
                     u['broken'] = False
                 else:
                     u['default'] = False
                     u['broken'] = False
-                    u['pstr'] = program_string
-                    if program_string in uniq_programs:
-                        uniq_programs[program_string][3] += 1
-                        uniq_programs[program_string][4].add(player_id)
+                    u['phash'] = phash
+                    if phash in uniq_programs:
+                        uniq_programs[phash][3] += 1
+                        uniq_programs[phash][4].add(player_id)
                     else:
-                        uniq_programs[program_string] = [dtype, graph, program, 1, set([player_id])]
-                    pl_uniq_programs.append(program_string)
+                        uniq_programs[phash] = [dtype, graph, program, 1, set([player_id])]
+                    pl_uniq_programs.append(phash)
                 units.append(u)
             if 'assets' not in the_roster:
                 the_roster['assets'] = set([asset])
@@ -75,7 +75,7 @@ if __name__ == '__main__':
                     else:
                         stat_programmed_drones += 1
                         stat_prog_units[u['type']] += 1
-                        isom = uniq_programs[u['pstr']][-1]
+                        isom = uniq_programs[u['phash']][-1]
                         if isom['isomorphic to default']:
                             stat_isom_program += 1
                         if isom['extended default']:
@@ -110,7 +110,7 @@ if __name__ == '__main__':
     i = 0
     print('Top {} start programs (by usage):'.format(TOP_PROGRAMS))
     print('                                                       pls          units I No Ed Ac a o D O R M')
-    for pstr, pvalues in sorted(uniq_programs.items(), key=lambda k: (len(k[1][4]), k[1][3]), reverse=True):
+    for phash, pvalues in sorted(uniq_programs.items(), key=lambda k: (len(k[1][4]), k[1][3]), reverse=True):
         utype, graph_id, program, count, players, isom = pvalues
         print('{:15} {} {:5} {:5} ({:5.1f}%) {} {}  {} {} {} {} {} {} {} {}'.format(utype,
                                                                                     graph_id, 
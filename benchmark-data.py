@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+# -----------------------------------------------------------------------------
+#  The Berloga Apiary Defence statistics analysis tool
+#
+#  Data loading benchmarks
+#
+#  Copyright (C) 2025 Alexey Fedoseev <aleksey@fedoseev.net>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see https://www.gnu.org/licenses/
+#  -----------------------------------------------------------------------------
+
+import sys
+import os
+import csv
+import time
+import tempfile
+import shutil
+import gzip
+import lzma
+import tracemalloc
+
+import data
+
+DEFAULT_PLAYERS_DATA = 'test.csv'
+DEFAULT_SCALE = 100
+
+def usage(msg = ''):
+    print("Usage: {} <test> [database-path] [scale]".format(sys.argv[0]))
+    print("Tests: {}".format(', '.join(TESTS.keys())))
+    if msg:
+        print(msg)
+    exit(1)
+
+def load_column(csv_file, column, scale):
+    values = []
+    with open(csv_file) as f:
+        for row in csv.reader(f):
+            if len(row) != data._CSV_SIZE or row[data._CSV_ID] == 'id':
+                continue
+            values.append(row[column])
+    return values * scale
+
+def measure(name, func, values):
+    start = time.perf_counter()
+    for v in values:
+        func(v)
+    duration = time.perf_counter() - start
+    print('{:20}: {:8.3f} s, {:8.0f} rows/s'.format(name, duration, len(values) / duration))
+    return duration
+
+def bench_datetime(csv_file, scale):
+    values = load_column(csv_file, data._CSV_DATETIME, scale)
+    print('created_at values: {}'.format(len(values)))
+    for v in values:
+        if data.parse_datetime(v) != data.parse_datetime_strptime(v):
+            print('Decoders mismatch on {}'.format(v))
+            exit(1)
+    old = measure('strptime', data.parse_datetime_strptime, values)
+    new = measure('parse_datetime', data.parse_datetime, values)
+    print('speedup: {:5.1f}x'.format(old / new))
+
+def measure_loader(name, loader, csv_file):
+    tracemalloc.start()
+    start = time.perf_counter()
+    players = loader(csv_file)
+    duration = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:20}: {:8.3f} s, {:8.1f} MB kept, {:8.1f} MB peak'.format(name, duration, current / 2**20, peak / 2**20))
+    return players
+
+def bench_columns(csv_file, scale):
+    measure_loader('read_players_data', data.read_players_data, csv_file)
+    measure_loader('read_players_columns', data.read_players_columns, csv_file)
+
+def count_rows(csv_file):
+    with open(csv_file) as f:
+        return sum(1 for _ in f) - 1
+
+def bench_memory(csv_file, scale):
+    rows = count_rows(csv_file) / 1e6
+    for name, loader in (('read_players_data', data.read_players_data),
+                         ('read_players_sessions', data.read_players_sessions)):
+        tracemalloc.start()
+        players = loader(csv_file)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del players
+        print('{:20}: {:8.1f} MB per million rows'.format(name, current / 2**20 / rows))
+
+def bench_workers(csv_file, scale):
+    data.USE_CACHE = False
+    single = None
+    for workers in (1, 2, 4, 8):
+        start = time.perf_counter()
+        data.read_players_data(csv_file, None, None, ',', workers)
+        duration = time.perf_counter() - start
+        if single is None:
+            single = duration
+        print('{:2} workers: {:8.3f} s, speedup {:5.2f}x'.format(workers, duration, single / duration))
+
+def read_lines(filename):
+    size = 0
+    with data.open_data_file(filename) as f:
+        for line in f:
+            size += len(line)
+    return size
+
+def bench_compressed(csv_file, scale):
+    data.USE_CACHE = False
+    tmp_dir = tempfile.mkdtemp()
+    files = [csv_file]
+    with open(csv_file, 'rb') as f:
+        content = f.read()
+    for suffix, compress in (('.gz', gzip.compress), ('.xz', lzma.compress),
+                             ('.zst', data.zstandard.compress if data.zstandard else None)):
+        if compress is None:
+            continue
+        filename = os.path.join(tmp_dir, os.path.basename(csv_file) + suffix)
+        with open(filename, 'wb') as f:
+            f.write(compress(content))
+        files.append(filename)
+    for filename in files:
+        name = os.path.basename(filename)
+        for background in (False, True):
+            if background and not data.is_compressed(filename):
+                continue
+            data.BACKGROUND_DECOMPRESSION = background
+            start = time.perf_counter()
+            size = read_lines(filename)
+            lines = time.perf_counter() - start
+            start = time.perf_counter()
+            data.read_players_data(filename)
+            parse = time.perf_counter() - start
+            print('{:24} {:10}: lines {:8.1f} MB/s, read_players_data {:8.3f} s'.format(
+                name, 'thread' if background else '', size / 2**20 / lines, parse))
+    shutil.rmtree(tmp_dir)
+
+def bench_mmap(csv_file, scale):
+    # the mapped lines of the filtered out players are never decoded
+    data.USE_CACHE = False
+    player = load_column(csv_file, data._CSV_PLAYER, 1)[0]
+    for name, player_filter in (('all players', None), ('one player', {player: None})):
+        durations = []
+        for mmap_reader in (False, True):
+            data.MMAP_READER = mmap_reader
+            start = time.perf_counter()
+            data.read_players_data(csv_file, player_filter)
+            durations.append(time.perf_counter() - start)
+        print('{:20}: text {:8.3f} s, mmap {:8.3f} s, speedup {:5.2f}x'.format(
+            name, durations[0], durations[1], durations[0] / durations[1]))
+
+def bench_sources(csv_file, scale):
+    # overlapping exports: every file has a half of the rows shifted by
+    # an eighth of the rows from the previous one
+    data.USE_CACHE = False
+    tmp_dir = tempfile.mkdtemp()
+    with open(csv_file) as f:
+        header = f.readline()
+        lines = f.readlines()
+    window = len(lines) // 2
+    step = len(lines) // 8
+    files = []
+    for k in range(5):
+        filename = os.path.join(tmp_dir, 'export{}.csv'.format(k))
+        with open(filename, 'w') as f:
+            f.write(header)
+            f.writelines(lines[k * step:k * step + window])
+        files.append(filename)
+    del lines
+    for n in range(1, len(files) + 1):
+        tracemalloc.start()
+        players = data.read_players_sources(files[:n])
+        merged, merged_peak = tracemalloc.get_traced_memory()
+        del players
+        tracemalloc.stop()
+        tracemalloc.start()
+        separate = [data.read_players_data(f) for f in files[:n]]
+        current, peak = tracemalloc.get_traced_memory()
+        del separate
+        tracemalloc.stop()
+        print('{} files: merged {:8.1f} MB ({:8.1f} MB peak), separate {:8.1f} MB ({:8.1f} MB peak)'.format(
+            n, merged / 2**20, merged_peak / 2**20, current / 2**20, peak / 2**20))
+    shutil.rmtree(tmp_dir)
+
+def bench_sessions(csv_file, scale):
+    players = data.read_players_data(csv_file)
+    start = time.perf_counter()
+    for _, datetable, sessions in players.values():
+        data.reconstruct_player_sessions(datetable, sessions)
+    old = time.perf_counter() - start
+    expected = {player: [repr(s) for s in values[2]] for player, values in players.items()}
+    for values in players.values():
+        del values[2][:]
+    start = time.perf_counter()
+    data.reconstruct_players_sessions(players)
+    new = time.perf_counter() - start
+    if expected != {player: [repr(s) for s in values[2]] for player, values in players.items()}:
+        print('Sessions mismatch')
+        exit(1)
+    print('{:20}: {:8.3f} s'.format('per player', old))
+    print('{:20}: {:8.3f} s'.format('vectorized', new))
+    print('speedup: {:5.1f}x'.format(old / new))
+    for workers in (2, 4, 8):
+        for values in players.values():
+            del values[2][:]
+        start = time.perf_counter()
+        data.reconstruct_sessions_parallel(players, workers)
+        duration = time.perf_counter() - start
+        if expected != {player: [repr(s) for s in values[2]] for player, values in players.items()}:
+            print('Sessions mismatch with {} workers'.format(workers))
+            exit(1)
+        print('{:20}: {:8.3f} s'.format('{} workers'.format(workers), duration))
+
+def bench_aggregates(csv_file, scale):
+    # the lazy aggregates must not depend on the order of the first reads
+    data.USE_CACHE = False
+    for vectorized in (False, True):
+        data.VECTORIZED_SESSIONS = vectorized
+        players = data.read_players_sessions(csv_file)
+        lazy = [s['avg_wons'] for values in players.values() for s in values[2]]
+        lazy_bee = [s['avg_bee'] for values in players.values() for s in values[2]]
+        for values in players.values():
+            for s in values[2]:
+                data.session_tries_stats(s)
+        eager = [s.avg_wons for values in players.values() for s in values[2]]
+        eager_bee = [s.avg_bee for values in players.values() for s in values[2]]
+        if lazy != eager or lazy_bee != eager_bee:
+            print('Aggregates mismatch, vectorized {}'.format(vectorized))
+            exit(1)
+        print('{:20}: {} sessions match'.format('vectorized' if vectorized else 'per player', len(lazy)))
+
+TESTS = {
+    'datetime': bench_datetime,
+    'columns': bench_columns,
+    'memory': bench_memory,
+    'workers': bench_workers,
+    'compressed': bench_compressed,
+    'mmap': bench_mmap,
+    'sources': bench_sources,
+    'sessions': bench_sessions,
+    'aggregates': bench_aggregates
+}
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 or len(sys.argv) > 4:
+        usage()
+    test = sys.argv[1]
+    if test not in TESTS:
+        usage('Unknown test {}'.format(test))
+    Players_data = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PLAYERS_DATA
+    Scale = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_SCALE
+
+    TESTS[test](Players_data, Scale)
@@ -33,6 +33,8 @@ LIMIT = 15
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) < 2:
         Players_data = DEFAULT_PLAYERS_DATA
     else:
@@ -46,10 +48,10 @@ if __name__ == '__main__':
     Best_Programs = {}
     Best_Uniq_Programs = {}
     Best_Player_Programs = {}
+    data.load_players_programs(Players.keys(), Programs, Unique_programs, Unique_programs_with_names)
     
     for player, values in Players.items():        
         activities, _, sessions = values
-        data.load_player_programs(player, Programs, Unique_programs, Unique_programs_with_names)
         for s in sessions:
             for artefact, unit_data in s['art'].items():
                 if artefact in Programs:
@@ -6,8 +6,10 @@ import data
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) != 3:
-        print('usage: {} <database.csv> <talent-table.csv>')
+        print('usage: {} [--no-cache] [--mmap] [--workers N] <database.csv> <talent-table.csv>')
         exit(1)
 
     DB_FILE = sys.argv[1]
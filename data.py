@@ -20,17 +20,49 @@
 #  along with this program. If not, see https://www.gnu.org/licenses/
 #  ----------------------------------------------------------------------------- 
 
+import sys
 import os
 import csv
 import urllib.request
 import datetime
 import hashlib
+import array
+import bisect
+import pickle
+import gc
+import io
+import concurrent.futures
+import multiprocessing
+import gzip
+import lzma
+import threading
+import queue
+import mmap
+import operator
+import itertools
+import sqlite3
+import json
+import atexit
+import zlib
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 import CyberiadaML
 
 DEFAULT_PROGRAMS_DIR = 'default_programs'
 NEW_VERSION = '1.6'
 PROGRAMS_DIR = 'programs'
+ARTEFACT_INDEX = 'artefacts.index'
+PROGRAMS_ARCHIVE = 'programs.pack'
 LAST_WAVE_METRICS = 'last_wave'
 LEVEL_START = 'Start'
 LEVEL_INFINITY = 'Infinity'
@@ -97,12 +129,366 @@ _CSV_METRICS_VALUE = 7
 _CSV_ARTEFACT = 8
 _CSV_CHECKSUM = 9
 _CSV_SIZE = 10
+CSV_DELIMITER = ','
 
 _MAX_SESSION_LENGTH = 6 * 3600.0
 
+CACHE_DIR = '.cache'
+CACHE_FORMAT = 1
+NO_CACHE_OPTION = '--no-cache'
+USE_CACHE = True
+# the ingest state is rewritten when the rows appended since the last
+# snapshot exceed this part of the data file
+INGEST_SNAPSHOT_RATIO = 0.1
+_INGEST_TAIL_SIZE = 4096
+MMAP_OPTION = '--mmap'
+# read the plain CSV files through mmap splitting the lines without quotes
+# without the csv module
+MMAP_READER = False
+COLUMNAR_OPTION = '--columnar'
+# read the players' activities into the columnar store of NumPy arrays in
+# the scripts supporting it
+COLUMNAR_STORE = False
+WORKERS_OPTION = '--workers'
+WORKERS = 1
+# the files smaller than PARALLEL_MIN_SIZE bytes are parsed sequentially
+PARALLEL_MIN_SIZE = 16 * 2 ** 20
+PARALLEL_CHUNK_SIZE = 64 * 2 ** 20
+COMPRESSED_SUFFIXES = ('.gz', '.xz', '.zst')
+# decompress in a separate thread to overlap the inflation with parsing
+BACKGROUND_DECOMPRESSION = True
+_DECOMPRESS_BLOCK_SIZE = 2 ** 20
+_DECOMPRESS_QUEUE_SIZE = 16
+# reconstruct the sessions of all the players on NumPy arrays when available
+VECTORIZED_SESSIONS = True
+# the sessions of fewer activities are reconstructed sequentially
+PARALLEL_MIN_ACTIVITIES = 100000
+PARALLEL_SESSIONS_CHUNKS = 4
+# the filters of at most this number of players read the players' lines
+# through the byte ranges of the player index
+PLAYER_INDEX_MAX_PLAYERS = 16
+SHARD_MANIFEST = 'manifest.json'
+# the parse results of the program files by their md5, kept in the cache
+# directory for all the data files
+PROGRAMS_CACHE = 'programs.pickle'
+PROGRAMS_CACHE_FORMAT = 2
+# the md5 of the program files by their paths, sizes and mtimes
+PROGRAM_FILES_CACHE = 'program-files.pickle'
+# the program files of fewer players' programs are parsed sequentially
+PARALLEL_MIN_PROGRAMS = 1000
+PARALLEL_PROGRAMS_CHUNKS = 4
+SQLITE_OPTION = '--sqlite'
+# query the SQLite copy of the players' activities and sessions kept in the
+# cache directory
+USE_SQLITE = False
+
 def get_artefact_file(player_id, artefact_id):
     return os.path.join(PROGRAMS_DIR, player_id, artefact_id) + ".graphml"
 
+def parse_data_options(argv):
+    global USE_CACHE, MMAP_READER, WORKERS, USE_SQLITE, COLUMNAR_STORE
+    if NO_CACHE_OPTION in argv:
+        argv.remove(NO_CACHE_OPTION)
+        USE_CACHE = False
+    if SQLITE_OPTION in argv:
+        argv.remove(SQLITE_OPTION)
+        USE_SQLITE = True
+    if MMAP_OPTION in argv:
+        argv.remove(MMAP_OPTION)
+        MMAP_READER = True
+    if COLUMNAR_OPTION in argv:
+        argv.remove(COLUMNAR_OPTION)
+        COLUMNAR_STORE = True
+    if WORKERS_OPTION in argv:
+        idx = argv.index(WORKERS_OPTION)
+        if idx + 1 >= len(argv) or not argv[idx + 1].isdigit() or int(argv[idx + 1]) < 1:
+            print('Bad {} value: the number of processes expected'.format(WORKERS_OPTION))
+            exit(1)
+        WORKERS = int(argv[idx + 1])
+        del argv[idx:idx + 2]
+
+def cache_file(kind, csv_file, player_filter = None, blacklist_filter = None, *args):
+    # the cache file name depends on the data file and the filters, its header
+    # keeps the data file fingerprint to detect outdated snapshots
+    key = [kind, os.path.abspath(csv_file), FILTER_VERSION]
+    if player_filter:
+        key.append(sorted(player_filter.items()))
+    else:
+        key.append(None)
+    if blacklist_filter:
+        key.append(sorted(blacklist_filter))
+    else:
+        key.append(None)
+    key.extend(args)
+    name = '{}-{}.pickle'.format(kind, hashlib.md5(repr(key).encode('utf-8')).hexdigest())
+    return os.path.join(CACHE_DIR, name), csv_file
+
+def code_fingerprint():
+    return (CACHE_FORMAT, os.stat(__file__).st_mtime_ns)
+
+def cache_fingerprint(csv_file):
+    if os.path.isdir(csv_file):
+        # the shard directory changes with its manifest and shard files
+        names = [SHARD_MANIFEST] + load_shard_manifest(csv_file)['files']
+        stats = [os.stat(os.path.join(csv_file, name)) for name in names]
+        return code_fingerprint() + tuple((st.st_size, st.st_mtime_ns) for st in stats)
+    st = os.stat(csv_file)
+    return code_fingerprint() + (st.st_size, st.st_mtime_ns)
+
+def load_cache(cache, fingerprint = None):
+    path, csv_file = cache
+    if not USE_CACHE or not os.path.isfile(path):
+        return None
+    if fingerprint is None:
+        fingerprint = cache_fingerprint(csv_file)
+    # the snapshots hold millions of small objects, the collector only slows
+    # down their (de)serialization
+    gc.disable()
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) != fingerprint:
+                return None
+            value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        print('Cannot read the cache file {}'.format(path))
+        return None
+    finally:
+        gc.enable()
+    print('read from cache {}'.format(path))
+    return value
+
+def save_cache(cache, value, fingerprint = None):
+    path, csv_file = cache
+    if not USE_CACHE:
+        return
+    if fingerprint is None:
+        fingerprint = cache_fingerprint(csv_file)
+    if not os.path.isdir(CACHE_DIR):
+        os.mkdir(CACHE_DIR)
+    tmp_path = path + '.tmp'
+    gc.disable()
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(fingerprint, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+    finally:
+        gc.enable()
+    os.replace(tmp_path, path)
+
+def read_ingest_tail(csv_file, offset):
+    start = max(0, offset - _INGEST_TAIL_SIZE)
+    with open(csv_file, 'rb') as f:
+        f.seek(start)
+        return f.read(offset - start)
+
+def read_ingest_head(csv_file, offset):
+    with open(csv_file, 'rb') as f:
+        return f.read(min(offset, _INGEST_TAIL_SIZE))
+
+def data_file_identity(csv_file):
+    st = os.stat(csv_file)
+    return (st.st_dev, st.st_ino)
+
+def data_file_appended(csv_file, state, delimiter):
+    # the state is valid while the data file only grows: it is the same
+    # file, and its first and last _INGEST_TAIL_SIZE bytes before the stored
+    # offset and the last processed row are unchanged; the rows between
+    # them are not checked
+    offset = state['offset']
+    if os.path.getsize(csv_file) < offset or data_file_identity(csv_file) != state['identity']:
+        return False
+    if hashlib.md5(read_ingest_head(csv_file, offset)).hexdigest() != state['head']:
+        return False
+    tail = read_ingest_tail(csv_file, offset)
+    if hashlib.md5(tail).hexdigest() != state['tail']:
+        return False
+    if is_compressed(csv_file):
+        # the new compressed streams are appended after the offset
+        return True
+    last_line = tail.rstrip(b'\r\n').rsplit(b'\n', 1)[-1].decode('utf-8', 'replace')
+    if state['last_id'] is not None and not last_line.startswith(state['last_id'] + delimiter):
+        return False
+    return True
+
+def load_ingest_state(cache, delimiter):
+    state = load_cache(cache, code_fingerprint())
+    if state is None or not data_file_appended(cache[1], state, delimiter):
+        return None
+    return state
+
+def save_ingest_state(cache, state):
+    state['identity'] = data_file_identity(cache[1])
+    state['head'] = hashlib.md5(read_ingest_head(cache[1], state['offset'])).hexdigest()
+    state['tail'] = hashlib.md5(read_ingest_tail(cache[1], state['offset'])).hexdigest()
+    save_cache(cache, state, code_fingerprint())
+
+def is_compressed(filename):
+    return os.path.splitext(filename)[1] in COMPRESSED_SUFFIXES
+
+class BackgroundReader(io.RawIOBase):
+    # reads the decompressed stream in a thread, the compression libraries
+    # release the GIL while inflating the blocks
+    def __init__(self, stream):
+        self.stream = stream
+        self.blocks = queue.Queue(_DECOMPRESS_QUEUE_SIZE)
+        self.block = b''
+        self.pos = 0
+        self.eof = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stopped:
+                block = self.stream.read(_DECOMPRESS_BLOCK_SIZE)
+                self.blocks.put(block)
+                if not block:
+                    break
+        except Exception as e:
+            self.blocks.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self.pos == len(self.block):
+            if self.eof:
+                return 0
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                self.eof = True
+                return 0
+            self.block = block
+            self.pos = 0
+        size = min(len(b), len(self.block) - self.pos)
+        b[:size] = self.block[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped = True
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.stream.close()
+        super().close()
+
+class CompressedDataFile(io.TextIOWrapper):
+    # text stream over a compressed data file, the position is counted in
+    # the compressed file bytes
+    def __init__(self, filename, offset = 0):
+        ext = os.path.splitext(filename)[1]
+        self.compressed_file = open(filename, 'rb')
+        self.compressed_file.seek(offset)
+        if ext == '.gz':
+            stream = gzip.GzipFile(fileobj=self.compressed_file)
+        elif ext == '.xz':
+            stream = lzma.LZMAFile(self.compressed_file)
+        else:
+            if zstandard is None:
+                print('Cannot read {}: the zstandard module is not installed'.format(filename))
+                exit(1)
+            stream = zstandard.ZstdDecompressor().stream_reader(self.compressed_file,
+                                                                read_across_frames=True)
+        if BACKGROUND_DECOMPRESSION:
+            stream = io.BufferedReader(BackgroundReader(stream), _DECOMPRESS_BLOCK_SIZE)
+        super().__init__(stream)
+
+    def position(self):
+        return self.compressed_file.tell()
+
+    def close(self):
+        super().close()
+        self.compressed_file.close()
+
+def open_data_file(filename, offset = 0):
+    # the compressed files are read from the offset as the concatenated
+    # gzip/xz/zstd streams
+    if is_compressed(filename):
+        return CompressedDataFile(filename, offset)
+    f = open(filename)
+    if offset > 0:
+        f.seek(offset)
+    return f
+
+def create_data_file(filename):
+    # the binary writer compressing by the file suffix as open_data_file() reads
+    suffix = os.path.splitext(filename)[1]
+    if suffix == '.gz':
+        return gzip.open(filename, 'wb')
+    if suffix == '.xz':
+        return lzma.open(filename, 'wb')
+    if suffix == '.zst':
+        return zstandard.ZstdCompressor().stream_writer(open(filename, 'wb'))
+    return open(filename, 'wb')
+
+def data_file_position(f):
+    if isinstance(f, CompressedDataFile):
+        return f.position()
+    return f.tell()
+
+# created_at decoding cache: the last decoded value and the last date/second prefixes
+_datetime_cache = [None, None, None, None, None, None]
+
+def parse_datetime_strptime(s):
+    if s.find('.') > 0:
+        d = datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S.%f+03')
+    else:
+        d = datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S+03')
+    return d.timestamp(), datetime.datetime.strftime(d, '%Y-%m-%d'), d
+
+def parse_datetime(s):
+    # fast decoder for the server created_at format: YYYY-MM-DD HH:MM:SS[.ffffff]+03
+    # returns (timestamp, date string, datetime) as parse_datetime_strptime does
+    cache = _datetime_cache
+    if s == cache[0]:
+        return cache[1]
+    size = len(s)
+    if (size < 22 or size > 29 or s[19] not in '.+' or s[-3:] != '+03' or
+        s[4] != '-' or s[7] != '-' or s[10] != ' ' or s[13] != ':' or s[16] != ':'):
+        return parse_datetime_strptime(s)
+    if size == 22:
+        us = 0
+    else:
+        frac = s[20:-3]
+        if size == 23 or not frac.isdigit():
+            return parse_datetime_strptime(s)
+        us = int(frac) * 10 ** (6 - len(frac))
+    prefix = s[:19]
+    if prefix != cache[2]:
+        day = cache[4] if s[:10] == cache[4] else s[:10]
+        if day != cache[4]:
+            if not (s[0:4].isdigit() and s[5:7].isdigit() and s[8:10].isdigit()):
+                return parse_datetime_strptime(s)
+            try:
+                date = datetime.date(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+            except ValueError:
+                return parse_datetime_strptime(s)
+            cache[4] = day
+            cache[5] = date
+        if not (s[11:13].isdigit() and s[14:16].isdigit() and s[17:19].isdigit()):
+            return parse_datetime_strptime(s)
+        try:
+            base = datetime.datetime.combine(cache[5], datetime.time(int(s[11:13]), int(s[14:16]), int(s[17:19])))
+        except ValueError:
+            return parse_datetime_strptime(s)
+        cache[2] = prefix
+        cache[3] = (int(base.timestamp()), day, base)
+    seconds, day, base = cache[3]
+    if us == 0:
+        result = (float(seconds), day, base)
+    else:
+        result = (seconds + us / 1e6, day, base.replace(microsecond=us))
+    cache[0] = s
+    cache[1] = result
+    return result
+
 def pack_player(player, idx):
     return "{}:{}".format(player, idx)
 def unpack_player(player):
@@ -111,17 +497,410 @@ def unpack_player(player):
     else:
         return player
 
-def read_players_data(csv_file, player_filter = None, blacklist_filter = None, delimiter=','):
-    players = {}
-    print('read from file {}'.format(csv_file))
-    the_file = open(csv_file)
-    reader = csv.reader(the_file, delimiter=delimiter)
-    i = 0
+def decode_origin_context(level, origin, i):
+    if level not in LEVELS:
+        print("Cannot read players' database from CSV: bad stat level {} at row {}".format(level, i))
+        exit(1)
+    if origin in UNITS:
+        return 'u', level, origin, None
+    elif origin in TRADITIONS:
+        return 't', level, None, origin
+    else:
+        print("Cannot read players' database from CSV: bad stat origin {} at row {}".format(origin, i))
+        exit(1)
+
+def decode_level_context(context, i):
+    _, level, origin = context.split('_')
+    return decode_origin_context(level, origin, i)
+
+def decode_polygon_context(context, i):
+    return decode_origin_context(LEVEL_POLYGON, context.split('_')[2], i)
+
+def decode_results_context(context, i):
+    tradition = None
+    for tr, trad in TRADITIONS_RU.items():
+        if context.find(tr):
+            tradition = trad
+            break
+    return 'f', None, None, tradition
+
+# context -> (activity type, level, unit, tradition)
+CONTEXTS = {
+    _CONTEXT_POLYGON_AB: ('u', LEVEL_POLYGON, UNITS[0], None),
+    _CONTEXT_POLYGON_SM: ('u', LEVEL_POLYGON, UNITS[2], None),
+    _CONTEXT_RESULTS_POLYGON: ('p', None, None, None),
+    _CONTEXT_START_PL: ('sp', None, None, None),
+    _CONTEXT_FINISH_PL: ('fp', None, None, None),
+    _CONTEXT_START_GAME: ('sg', None, None, None),
+    _CONTEXT_CLOSE_GAME: ('fg', None, None, None),
+    _CONTEXT_OPEN_EDITOR: ('se', None, None, None),
+    _CONTEXT_CLOSE_EDITOR: ('fe', None, None, None),
+    _CONTEXT_SAVE_PROGRAM: ('s', None, None, None),
+    _CONTEXT_PLATFORM_ANDROID: ('pl_a', None, None, None),
+    _CONTEXT_PLATFORM_WINDOWS: ('pl_w', None, None, None),
+    _CONTEXT_PLATFORM_LINUX: ('pl_l', None, None, None)
+}
+# context prefix -> decoder(context, row)
+CONTEXT_PREFIXES = [
+    (_CONTEXT_LEVEL, decode_level_context),
+    (_CONTEXT_POLYGON, decode_polygon_context),
+    (_CONTEXT_RESULTS, decode_results_context)
+]
+_decoded_contexts = {}
+
+def register_context(context, act_type, level = None, unit = None, tradition = None):
+    CONTEXTS[context] = (act_type, level, unit, tradition)
+    _decoded_contexts.clear()
+
+def register_context_prefix(prefix, decoder):
+    CONTEXT_PREFIXES.append((prefix, decoder))
+    _decoded_contexts.clear()
+
+def decode_context(context, i):
+    # returns (activity type, level, unit, tradition) for the context string
+    try:
+        return _decoded_contexts[context]
+    except KeyError:
+        pass
+    result = CONTEXTS.get(context)
+    if result is None:
+        for prefix, decoder in CONTEXT_PREFIXES:
+            if context.find(prefix) == 0:
+                result = decoder(context, i)
+                break
+        else:
+            print("Cannot read players' database from CSV: unknown context {} at row {}".format(context, i))
+            exit(1)
+    _decoded_contexts[context] = result
+    return result
+
+def set_creation_index(a, value, i):
+    a.c = int(value)
+
+def set_try(a, value, i):
+    if a.t == 'f':
+        a.y = int(value)
+
+def set_final_level(a, value, i):
+    if a.t == 'f':
+        level = int(value)
+        if level < 0 or level >= len(LEVELS):
+            print("Bad final level {} at row {}".format(level, i))
+            level = len(LEVELS) - 1
+        a.l = LEVELS[level]
+
+def set_wave(a, value, i):
+    if not hasattr(a, 'w'):
+        a.w = int(value) + 1
+
+# the unit activities without the artefact in their first row keep the
+# counters in acc: a chunk may start inside an activity with the artefact
+def artefact_counters(a):
+    if hasattr(a, 'ac'):
+        return a.ac
+    return getattr(a, 'acc', None)
+
+def add_drone_damage(a, value, i):
+    ac = artefact_counters(a)
+    if ac is not None:
+        ac[2] += value
+
+def add_enemies_destroyed(a, value, i):
+    ac = artefact_counters(a)
+    if ac is not None:
+        ac[3] += int(value)
+
+def add_program_activation(a, value, i):
+    ac = artefact_counters(a)
+    if ac is not None:
+        ac[4] += int(value)
+
+def int_field_setter(field):
+    def setter(a, value, i):
+        setattr(a, field, int(value))
+    return setter
+
+def float_field_setter(field):
+    def setter(a, value, i):
+        setattr(a, field, value)
+    return setter
+
+def enemies_count_setter(metrics_key):
+    # the polygon results enemies counters, the other activities may use
+    # the same key for the base health
+    field = 'enm_be' if metrics_key.find('beetle') == 0 else 'enm_oth'
+    base = metrics_key.find('base_health_left') == 0
+    def setter(a, value, i):
+        if a.t == 'p':
+            setattr(a, field, int(value))
+        elif base:
+            a.base = int(value)
+    return setter
+
+# metrics key -> setter(activity, value, row)
+METRICS_KEYS = {
+    'creation_index': set_creation_index,
+    'try': set_try,
+    'level': set_final_level,
+    'last_wave': set_wave,
+    'wave': set_wave,
+    'drone_damage': add_drone_damage,
+    'enemies_destroyed': add_enemies_destroyed,
+    'manual_activation': int_field_setter('ma'),
+    'program_activation': add_program_activation,
+    'upgradeLevel': int_field_setter('upg_l'),
+    'health_left': int_field_setter('heal'),
+    'placement_time': float_field_setter('pls_t'),
+    'session_time': float_field_setter('gs_t'),
+    'editing_time': float_field_setter('es_t')
+}
+_metrics_setters = {}
+
+def register_metrics_key(metrics_key, setter):
+    METRICS_KEYS[metrics_key] = setter
+    _metrics_setters.clear()
+
+def metrics_setter(metrics_key):
+    # returns the setter for the metrics key or None, the keys with the
+    # variable parts are resolved once
+    setter = METRICS_KEYS.get(metrics_key)
+    if setter is None:
+        if metrics_key.find('_count') > 0:
+            setter = enemies_count_setter(metrics_key)
+        elif metrics_key.find('base_health_left') == 0:
+            setter = int_field_setter('base')
+    _metrics_setters[metrics_key] = setter
+    return setter
+
+class Record:
+    # dict-style read access to the slotted records for backwards compatibility
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self):
+        return [k for k in self.__slots__ if hasattr(self, k)]
+
+    def values(self):
+        return [getattr(self, k) for k in self.keys()]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class Activity(Record):
+    __slots__ = ('v', 'i', 'd', 'ddate', 'dpydate', 'm', 'c', 't', 'l', 'u', 'p', 'ac', 'acc', 'y', 'w',
+                 'ma', 'upg_l', 'heal', 'pls_t', 'gs_t', 'es_t', 'enm_be', 'enm_oth', 'base')
+
+    def __init__(self, version, metrics_id, d, d_date, d_pydate):
+        self.v = version
+        self.i = metrics_id
+        self.d = d
+        self.ddate = d_date
+        self.dpydate = d_pydate
+        self.m = {}
+        self.c = 0
+
+class Session(Record):
+    __slots__ = ('v', 'l', 'w', 'ws', 'sd', 'fd', 'smid', 'fmid', 'sidx', 'fidx', 'a', 'u', 't', 'art',
+                 'gs', 'pls', 'es', 'sa', 'ma', 'plat', 'wp', 'tries', 'units', 'punits',
+                 'avg_u', 'avg_p', 'avg_d', 'avg_bee', 'avg_bugs', 'avg_wons', 'avg_gs', 'avg_es',
+                 'edits', 'avg_pls', 'places')
+
+    def __init__(self, **fields):
+        for k, v in fields.items():
+            setattr(self, k, v)
+
+    # the aggregates are calculated on the first dict-style access and kept,
+    # the attribute access stays a plain slot lookup
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            calc = SESSION_AGGREGATES.get(key)
+            if calc is None:
+                raise KeyError(key)
+            calc(self)
+            return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in SESSION_AGGREGATES or Record.__contains__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        for key in SESSION_AGGREGATES:
+            self[key]
+        return Record.keys(self)
+
+class PlayerLineFilter:
+    # drops the lines of the filtered out players before the CSV decoding,
+    # the lines with quoted leading fields are left to the CSV reader; the
+    # lines continuing a quoted field follow the first line of their row
+    def __init__(self, lines, player_filter, blacklist_filter, delimiter):
+        self.lines = lines
+        self.player_filter = player_filter
+        self.blacklist_filter = blacklist_filter
+        self.delimiter = delimiter
+        self.skipped = 0
+        self.last_id = None
+
+    def __iter__(self):
+        player_filter = self.player_filter
+        blacklist_filter = self.blacklist_filter
+        delimiter = self.delimiter
+        quoted = False
+        keep = True
+        for line in self.lines:
+            if quoted:
+                quoted = line.count('"') % 2 == 0
+                if keep:
+                    yield line
+                continue
+            if '"' in line:
+                quoted = line.count('"') % 2 == 1
+            first = line.find(delimiter)
+            second = line.find(delimiter, first + 1)
+            third = line.find(delimiter, second + 1)
+            if third < 0 or line.find('"', 0, third) >= 0:
+                self.last_id = None
+                keep = True
+                yield line
+                continue
+            player_id = line[second + 1:third]
+            if ((player_filter and player_id not in player_filter) or
+                (blacklist_filter and player_id in blacklist_filter)):
+                self.skipped += 1
+                self.last_id = line[:first]
+                keep = False
+                continue
+            self.last_id = None
+            keep = True
+            yield line
+
+class MappedLineFilter(PlayerLineFilter):
+    # PlayerLineFilter on the raw lines of the mapped file: the id and player
+    # columns are sliced from the line bytes, only the kept lines are decoded
+    def __init__(self, lines, player_filter, blacklist_filter, delimiter):
+        PlayerLineFilter.__init__(self, lines,
+                                  set(p.encode('utf-8') for p in player_filter or ()),
+                                  set(p.encode('utf-8') for p in blacklist_filter or ()),
+                                  delimiter)
+
+    def __iter__(self):
+        player_filter = self.player_filter
+        blacklist_filter = self.blacklist_filter
+        separator = self.delimiter.encode('utf-8')
+        # the byte value test is faster than the subsequence one
+        quote = ord('"')
+        last_id = None
+        quoted = False
+        keep = True
+        for line in self.lines:
+            if quoted:
+                quoted = line.count(b'"') % 2 == 0
+                if keep:
+                    yield line.decode('utf-8')
+                continue
+            if quote in line:
+                quoted = line.count(b'"') % 2 == 1
+            first = line.find(separator)
+            second = line.find(separator, first + 1)
+            third = line.find(separator, second + 1)
+            if third < 0 or line.find(b'"', 0, third) >= 0:
+                last_id = None
+                keep = True
+                yield line.decode('utf-8')
+                continue
+            player_id = line[second + 1:third]
+            if ((player_filter and player_id not in player_filter) or
+                (blacklist_filter and player_id in blacklist_filter)):
+                self.skipped += 1
+                last_id = line[:first]
+                keep = False
+                continue
+            last_id = None
+            keep = True
+            yield line.decode('utf-8')
+        self.last_id = last_id.decode('utf-8') if last_id is not None else None
+
+def mmap_raw_lines(mm, start, finish):
+    # the lines of the mapped file between the byte offsets
+    mm.seek(start)
+    if finish >= len(mm):
+        return iter(mm.readline, b'')
+    return mmap_chunk_lines(mm, start, finish)
+
+def mmap_chunk_lines(mm, start, finish):
+    readline = mm.readline
+    pos = start
+    while pos < finish:
+        line = readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line
+
+def split_csv_lines(lines, delimiter=CSV_DELIMITER):
+    # the server exports quote only the fields with delimiters or quotes,
+    # the other lines are split without the csv module; the lines of a
+    # quoted field with line breaks are read as one row
+    lines = iter(lines)
+    for line in lines:
+        if '"' in line:
+            while line.count('"') % 2 == 1:
+                more = next(lines, None)
+                if more is None:
+                    break
+                line += more
+            yield from csv.reader([line], delimiter=delimiter)
+        else:
+            yield line.rstrip('\r\n').split(delimiter)
+
+def parse_players_lines(players, lines, i, player_filter, blacklist_filter, delimiter,
+                        row_reader = csv.reader, dedup = False, line_filter = PlayerLineFilter):
+    if not player_filter and not blacklist_filter:
+        if line_filter is MappedLineFilter:
+            lines = map(bytes.decode, lines)
+        return parse_players_rows(players, row_reader(lines, delimiter=delimiter), i,
+                                  player_filter, blacklist_filter, dedup)
+    lines = line_filter(lines, player_filter, blacklist_filter, delimiter)
+    i, last_id = parse_players_rows(players, row_reader(lines, delimiter=delimiter), i,
+                                    player_filter, blacklist_filter, dedup)
+    if lines.last_id is not None:
+        last_id = lines.last_id
+    return i + lines.skipped, last_id
+
+def parse_players_rows(players, reader, i, player_filter, blacklist_filter, dedup = False):
+    # updates the players' activities with the CSV rows, returns the row
+    # counter and the last row id; the repeated strings (player ids, versions,
+    # metrics keys) are interned, so every distinct value is stored once;
+    # with dedup the metrics already loaded for the activity are skipped
+    intern = sys.intern
+    setters = _metrics_setters
+    last_id = None
     for row in reader:
         i += 1
         if len(row) != _CSV_SIZE:
             print("Cannot read players' database from CSV: bad row {}".format(i))
             exit(1)
+        last_id = row[_CSV_ID]
         if row[_CSV_ID] == 'id':
             # skip header
             continue
@@ -140,15 +919,10 @@ def read_players_data(csv_file, player_filter = None, blacklist_filter = None, d
         app_version = row[_CSV_APP_VERSION]
         if FILTER_VERSION is not None and app_version == FILTER_VERSION:
             continue
+        app_version = intern(app_version)
 
         try:
-            if row[_CSV_DATETIME].find('.') > 0:
-                d = datetime.datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S.%f+03')
-            else:
-                d = datetime.datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S+03')
-            d_pydate = d
-            d_date = datetime.datetime.strftime(d, '%Y-%m-%d')
-            d = d.timestamp()
+            d, d_date, d_pydate = parse_datetime(row[_CSV_DATETIME])
         except ValueError:
             print("Cannot read players' database from CSV: bad data {} at row {}".format(row[_CSV_DATETIME], i))
             continue
@@ -156,446 +930,1710 @@ def read_players_data(csv_file, player_filter = None, blacklist_filter = None, d
         activity_id = row[_CSV_ID]
 
         if player_id not in players:
-            players[player_id] = ({}, [], [])
-
-        if activity_id not in players[player_id][0]:
-            players[player_id][0][activity_id] = {}
-
-        a = players[player_id][0][activity_id]
+            players[intern(player_id)] = ({}, [], [])
 
-        a['v'] = app_version
-        
+        activities = players[player_id][0]
         metrics_id = int(row[_CSV_METRICS_ID])
-        a['i'] = metrics_id
-        
-        if 'd' not in a:
-            a['d'] = d
-            a['ddate'] = d_date
-            a['dpydate'] = d_pydate
-            #players[player_id][1].append([d, 0, metrics_id, a])
-
-        metrics_key = row[_CSV_METRICS_KEY]
+        metrics_key = intern(row[_CSV_METRICS_KEY])
         metrics_value = float(row[_CSV_METRICS_VALUE])
 
-        if 'm' not in a:
-            a['m'] = {}
-        a['m'][metrics_key] = metrics_value
-        
-        if 't' not in a:
-            context = row[_CSV_CONTEXT]
-            if (context.find(_CONTEXT_LEVEL) == 0 or context.find(_CONTEXT_POLYGON) == 0 or
-                context == _CONTEXT_POLYGON_AB or context == _CONTEXT_POLYGON_SM):
-                if context.find(_CONTEXT_LEVEL) == 0:
-                    _, level, origin = row[_CSV_CONTEXT].split('_')
-                elif context == _CONTEXT_POLYGON_AB or context == _CONTEXT_POLYGON_SM:
-                    level = LEVEL_POLYGON
-                    if context == _CONTEXT_POLYGON_AB:
-                        origin = UNITS[0]
-                    else:
-                        origin = UNITS[2]
+        if activity_id not in activities:
+            a = Activity(app_version, metrics_id, d, d_date, d_pydate)
+            activities[activity_id] = a
+            act_type, level, unit, tradition = decode_context(row[_CSV_CONTEXT], i)
+            a.t = act_type
+            if level is not None:
+                a.l = level
+            if unit is not None:
+                a.u = unit
+                if len(row[_CSV_ARTEFACT]) > 0:
+                    a.ac = [row[_CSV_ARTEFACT], row[_CSV_CHECKSUM], 0.0, 0, 0]
                 else:
-                    origin = row[_CSV_CONTEXT].split('_')[2]
-                    level = LEVEL_POLYGON
-                if level not in LEVELS:
-                    print("Cannot read players' database from CSV: bad stat level {} at row {}".format(level, i))
-                    exit(1)
-                a['l'] = level
-                if origin in UNITS:
-                    a['t'] = 'u'
-                    a['u'] = origin
-                    if len(row[_CSV_ARTEFACT]) > 0 and 'ac' not in a:
-                        a['ac'] = [row[_CSV_ARTEFACT], row[_CSV_CHECKSUM], 0.0, 0, 0]
-                elif origin in TRADITIONS:
-                    a['t'] = 't'
-                    a['p'] = origin
-                else:
-                    print("Cannot read players' database from CSV: bad stat origin {} at row {}".format(origin, i))
-                    exit(1)
-            elif context.find(_CONTEXT_RESULTS) == 0:
-                a['t'] = 'f'
-                for tr, tradition in TRADITIONS_RU.items():
-                    if context.find(tr):
-                        a['p'] = tradition
+                    a.acc = [None, None, 0.0, 0, 0]
+            if tradition is not None:
+                a.p = tradition
+        else:
+            a = activities[activity_id]
+            if dedup and metrics_key in a.m:
+                continue
+            a.v = app_version
+            a.i = metrics_id
+
+        a.m[metrics_key] = metrics_value
+        try:
+            setter = setters[metrics_key]
+        except KeyError:
+            setter = metrics_setter(metrics_key)
+        if setter is not None:
+            setter(a, metrics_value, i)
+
+    return i, last_id
+
+def count_csv_rows(block, quoted):
+    # the line breaks outside the quoted fields of the block, quoted tells
+    # whether the block starts inside a quoted field; returns the count and
+    # the quoted state at the end of the block
+    rows = 0
+    pos = 0
+    while True:
+        q = block.find(b'"', pos)
+        end = len(block) if q < 0 else q
+        if not quoted:
+            rows += block.count(b'\n', pos, end)
+        if q < 0:
+            return rows, quoted
+        quoted = not quoted
+        pos = q + 1
+
+def split_csv_chunks(csv_file, start, finish, count):
+    # chunk bounds are moved to the beginning of the next row, the quoted
+    # fields may contain line breaks; returns (start, finish, rows before
+    # the chunk), the rows keep the row numbers of the errors
+    bounds = [start]
+    rows = [0]
+    total = 0
+    quoted = False
+    pos = start
+    with open(csv_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for k in range(1, count):
+            target = start + (finish - start) * k // count
+            if target <= pos:
+                continue
+            n, quoted = count_csv_rows(mm[pos:target], quoted)
+            total += n
+            pos = target
+            while pos < finish:
+                eol = mm.find(b'\n', pos, finish)
+                eol = finish if eol < 0 else eol + 1
+                n, quoted = count_csv_rows(mm[pos:eol], quoted)
+                total += n
+                pos = eol
+                if not quoted:
+                    break
+            if pos >= finish:
+                break
+            bounds.append(pos)
+            rows.append(total)
+    bounds.append(finish)
+    return list(zip(bounds[:-1], bounds[1:], rows))
+
+def parse_players_chunk(csv_file, start, finish, i, player_filter, blacklist_filter, delimiter):
+    # i is the number of the rows before the chunk
+    players = {}
+    if MMAP_READER:
+        with open(csv_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            i, last_id = parse_players_lines(players, mmap_raw_lines(mm, start, finish), i,
+                                             player_filter, blacklist_filter, delimiter, split_csv_lines,
+                                             line_filter=MappedLineFilter)
+        return players, i, last_id
+    with open(csv_file, 'rb') as f:
+        f.seek(start)
+        text = f.read(finish - start).decode('utf-8')
+    i, last_id = parse_players_lines(players, io.StringIO(text, newline=None), i,
+                                     player_filter, blacklist_filter, delimiter)
+    return players, i, last_id
+
+def merge_activity(a, b):
+    # b is the same activity read from the later rows; the context and the
+    # artefact of an activity do not change between its rows
+    a.v = b.v
+    a.i = b.i
+    a.m.update(b.m)
+    if 'creation_index' in b.m:
+        a.c = b.c
+    if a.t == 'f' and 'level' in b.m:
+        a.l = b.l
+    if not hasattr(a, 'w') and hasattr(b, 'w'):
+        a.w = b.w
+    ac = artefact_counters(a)
+    b_ac = artefact_counters(b)
+    if ac is not None and b_ac is not None:
+        ac[2] += b_ac[2]
+        ac[3] += b_ac[3]
+        ac[4] += b_ac[4]
+    for k in ('y', 'ma', 'upg_l', 'heal', 'pls_t', 'gs_t', 'es_t', 'enm_be', 'enm_oth', 'base'):
+        if hasattr(b, k):
+            setattr(a, k, getattr(b, k))
+
+def merge_players_activities(players, chunk_players):
+    for pl, values in chunk_players.items():
+        if pl not in players:
+            players[pl] = values
+            continue
+        activities = players[pl][0]
+        for aid, b in values[0].items():
+            if aid in activities:
+                merge_activity(activities[aid], b)
+            else:
+                activities[aid] = b
+
+def parse_players_parallel(players, csv_file, start, finish, i, player_filter, blacklist_filter, delimiter, workers):
+    # the chunks are parsed by the worker processes and merged in the file
+    # order, so the result does not depend on the number of workers; returns
+    # the row counter and the last row id
+    count = max(workers, (finish - start) // PARALLEL_CHUNK_SIZE + 1)
+    chunks = split_csv_chunks(csv_file, start, finish, count)
+    print('parse {} chunks with {} workers'.format(len(chunks), workers))
+    last_id = None
+    # the chunk results are acyclic, the collector is useless while they are
+    # built and transferred
+    gc.disable()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=gc.disable) as executor:
+            futures = [executor.submit(parse_players_chunk, csv_file, first, last, i + rows,
+                                       player_filter, blacklist_filter, delimiter)
+                       for first, last, rows in chunks]
+            for future in futures:
+                chunk_players, chunk_i, chunk_last_id = future.result()
+                merge_players_activities(players, chunk_players)
+                if chunk_last_id is not None:
+                    last_id = chunk_last_id
+    finally:
+        gc.enable()
+    return chunk_i, last_id
+
+def creation_index_ranges(cindexes, ranges):
+    # returns (first index, positions of the activities) for every range of
+    # the player's index list containing activities; the positions keep the
+    # activities order, the ranges may overlap
+    order = sorted(range(len(cindexes)), key=cindexes.__getitem__)
+    sorted_cindexes = [cindexes[k] for k in order]
+    result = []
+    for indexes in ranges:
+        if indexes is None: continue
+        first_index, last_index = indexes
+        lo = bisect.bisect_left(sorted_cindexes, first_index)
+        hi = bisect.bisect_right(sorted_cindexes, last_index)
+        if lo < hi:
+            result.append((first_index, sorted(order[lo:hi])))
+    return result
+
+def line_player(line, separator, delimiter):
+    # the raw player column bytes of the data line, the quoted lines are
+    # split with the csv module
+    first = line.find(separator)
+    second = line.find(separator, first + 1)
+    third = line.find(separator, second + 1)
+    if third < 0 or line.find(b'"', 0, third) >= 0:
+        row = next(csv.reader([line.decode('utf-8')], delimiter=delimiter), [])
+        return row[_CSV_PLAYER].encode('utf-8') if len(row) > _CSV_PLAYER else b''
+    return line[second + 1:third]
+
+def update_player_index(csv_file, index, delimiter):
+    # appends the byte ranges of the rows after the index offset, the
+    # adjacent rows of a player are merged into one range
+    players = index['players']
+    separator = delimiter.encode('utf-8')
+    pos = index['offset']
+    rows = index['rows']
+    line = None
+    with open(csv_file, 'rb') as f:
+        f.seek(pos)
+        # the lines of a quoted field with line breaks are one row
+        quote = ord('"')
+        for line in f:
+            if quote in line:
+                while line.count(b'"') % 2 == 1:
+                    more = next(f, None)
+                    if more is None:
                         break
-            elif context == _CONTEXT_RESULTS_POLYGON:
-                a['t'] = 'p'
-            elif context == _CONTEXT_START_PL:
-                a['t'] = 'sp'
-            elif context == _CONTEXT_FINISH_PL:
-                a['t'] = 'fp'
-            elif context == _CONTEXT_START_GAME:
-                a['t'] = 'sg'
-            elif context == _CONTEXT_CLOSE_GAME:
-                a['t'] = 'fg'
-            elif context == _CONTEXT_OPEN_EDITOR:
-                a['t'] = 'se'
-            elif context == _CONTEXT_CLOSE_EDITOR:
-                a['t'] = 'fe'
-            elif context == _CONTEXT_SAVE_PROGRAM:
-                a['t'] = 's'
-            elif context == _CONTEXT_PLATFORM_ANDROID:
-                a['t'] = 'pl_a'
-            elif context == _CONTEXT_PLATFORM_WINDOWS:
-                a['t'] = 'pl_w'
-            elif context == _CONTEXT_PLATFORM_LINUX:
-                a['t'] = 'pl_l'
+                    line += more
+            player = line_player(line, separator, delimiter)
+            finish = pos + len(line)
+            ranges = players.get(player)
+            if ranges is None:
+                players[player] = array.array('q', (pos, finish))
+            elif ranges[-1] == pos:
+                ranges[-1] = finish
             else:
-                print("Cannot read players' database from CSV: unknown context {} at row {}".format(context, i))
-                exit(1)                
+                ranges.append(pos)
+                ranges.append(finish)
+            pos = finish
+            rows += 1
+    if line is not None:
+        index['last_id'] = line[:line.find(separator)].decode('utf-8', 'replace')
+    index['offset'] = pos
+    index['rows'] = rows
+
+def read_player_index(csv_file, delimiter):
+    # the player index is validated like the ingest state and extended with
+    # the lines appended since it was saved
+    cache = cache_file('player-index', csv_file, None, None, delimiter)
+    index = load_cache(cache, code_fingerprint())
+    if index is None or not data_file_appended(csv_file, index, delimiter):
+        index = {'offset': 0, 'rows': 0, 'last_id': None, 'players': {}}
+    if index['offset'] < os.path.getsize(csv_file):
+        print('index players of {} from {} bytes'.format(csv_file, index['offset']))
+        update_player_index(csv_file, index, delimiter)
+        save_ingest_state(cache, index)
+    return index
+
+def range_lines(f, ranges):
+    for start, finish in ranges:
+        f.seek(start)
+        pos = start
+        while pos < finish:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode('utf-8')
+
+def parse_players_indexed(players, csv_file, start, player_filter, blacklist_filter, delimiter):
+    # parses only the lines of the filtered players after the start offset
+    index = read_player_index(csv_file, delimiter)
+    ranges = []
+    for player in player_filter:
+        player_ranges = index['players'].get(player.encode('utf-8'))
+        if player_ranges is None:
+            continue
+        for k in range(0, len(player_ranges), 2):
+            if player_ranges[k + 1] > start:
+                ranges.append((max(player_ranges[k], start), player_ranges[k + 1]))
+    ranges.sort()
+    with open(csv_file, 'rb') as f:
+        parse_players_lines(players, range_lines(f, ranges), 0,
+                            player_filter, blacklist_filter, delimiter)
+    return index['rows'], index['last_id'], index['offset']
+
+def parse_players_file(players, csv_file, start, i, player_filter, blacklist_filter, delimiter, workers, dedup = False):
+    # parses the file from the start offset, returns the row counter, the
+    # last row id and the offset after the last parsed row
+    size = os.path.getsize(csv_file)
+    if size == start:
+        return i, None, size
+    if (USE_CACHE and player_filter and len(player_filter) <= PLAYER_INDEX_MAX_PLAYERS and not dedup and
+        not is_compressed(csv_file)):
+        return parse_players_indexed(players, csv_file, start, player_filter, blacklist_filter, delimiter)
+    if workers > 1 and not dedup and not is_compressed(csv_file) and size - start >= PARALLEL_MIN_SIZE:
+        i, last_id = parse_players_parallel(players, csv_file, start, size, i,
+                                            player_filter, blacklist_filter, delimiter, workers)
+        return i, last_id, size
+    if MMAP_READER and not is_compressed(csv_file):
+        with open(csv_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            i, last_id = parse_players_lines(players, mmap_raw_lines(mm, start, len(mm)), i,
+                                             player_filter, blacklist_filter, delimiter, split_csv_lines, dedup,
+                                             MappedLineFilter)
+            return i, last_id, len(mm)
+    the_file = open_data_file(csv_file, start)
+    i, last_id = parse_players_lines(players, the_file, i,
+                                     player_filter, blacklist_filter, delimiter, csv.reader, dedup)
+    offset = data_file_position(the_file)
+    the_file.close()
+    return i, last_id, offset
+
+def build_players(players, player_filter):
+    # split multi-players
+    if player_filter:
+        to_delete = set([])
+        to_add = {}
+        for pl, pl_values in players.items():
+            if player_filter[pl] is None:
+                continue
+            activities, _, _ = pl_values
+            aids = list(activities.keys())
+            acts = list(activities.values())
+            for first_index, positions in creation_index_ranges([a.c for a in acts], player_filter[pl]):
+                new_player = pack_player(pl, first_index)
+                to_delete.add(pl)
+                if new_player not in to_add:
+                    to_add[new_player] = {}
+                new_activities = to_add[new_player]
+                for k in positions:
+                    new_activities[aids[k]] = acts[k]
+        for p in to_delete:
+            del players[p]
+        for p, v in to_add.items():
+            players[p] = (v, [], [])
+
+    # build date table
+    for pl, pl_values in players.items():
+        activities, datetable, _ = pl_values
+        for a in activities.values():
+            if hasattr(a, 'ac') and type(a.ac) is list:
+                a.ac = tuple(a.ac)
+            if hasattr(a, 'acc'):
+                del a.acc
+            datetable.append([a.d, a.c, a.i, a])
+
+def ingest_players_data(csv_file, player_filter, blacklist_filter, delimiter, workers):
+    # the raw per-player state is kept with the byte offset and the last row id
+    # processed, so only the rows appended since the last run are parsed;
+    # returns the players with the offset and the last row id of the data
+    cache = cache_file('ingest', csv_file, player_filter, blacklist_filter, delimiter)
+    state = load_ingest_state(cache, delimiter)
+    if state is None:
+        state = {'offset': 0, 'rows': 0, 'last_id': None, 'players': {}}
+        print('read from file {}'.format(csv_file))
+    else:
+        print('read from file {} after row {} ({} bytes)'.format(csv_file, state['last_id'], state['offset']))
+    players = state['players']
+    if workers is None:
+        workers = WORKERS
+    i, last_id, offset = parse_players_file(players, csv_file, state['offset'], state['rows'],
+                                            player_filter, blacklist_filter, delimiter, workers)
+    if last_id is None:
+        last_id = state['last_id']
+    if offset - state['offset'] > INGEST_SNAPSHOT_RATIO * state['offset']:
+        state['offset'] = offset
+        state['rows'] = i
+        state['last_id'] = last_id
+        save_ingest_state(cache, state)
+
+    build_players(players, player_filter)
+
+    print(i, "lines loaded")
+    return players, offset, last_id
+
+def player_shard(player, count):
+    # the stable shard number of the player id
+    return int(hashlib.md5(player.encode('utf-8')).hexdigest()[:8], 16) % count
+
+def load_shard_manifest(shard_dir):
+    path = os.path.join(shard_dir, SHARD_MANIFEST)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print('Cannot read the shard manifest {}'.format(path))
+        exit(1)
+
+def read_players_shard(shard_file, player_filter, blacklist_filter, delimiter):
+    return ingest_players_data(shard_file, player_filter, blacklist_filter, delimiter, 1)[0]
+
+def read_players_shards(shard_dir, player_filter, blacklist_filter, delimiter, workers):
+    # the players are hash-partitioned over the shards written by split-data.py:
+    # a player filter reads only the shards of its players, the other shards
+    # are read by the worker processes
+    manifest = load_shard_manifest(shard_dir)
+    files = [os.path.join(shard_dir, name) for name in manifest['files']]
+    if player_filter:
+        needed = set(player_shard(player, len(files)) for player in player_filter)
+        files = [f for k, f in enumerate(files) if k in needed]
+    players = {}
+    if workers > 1 and len(files) > 1:
+        print('read {} shards with {} workers'.format(len(files), workers))
+        gc.disable()
+        try:
+            with concurrent.futures.ProcessPoolExecutor(workers, initializer=gc.disable) as executor:
+                futures = [executor.submit(read_players_shard, f, player_filter, blacklist_filter, delimiter)
+                           for f in files]
+                for future in futures:
+                    players.update(future.result())
+        finally:
+            gc.enable()
+    else:
+        for f in files:
+            players.update(ingest_players_data(f, player_filter, blacklist_filter, delimiter, workers)[0])
+    return players
+
+def read_players_data(csv_file, player_filter = None, blacklist_filter = None, delimiter=CSV_DELIMITER, workers = None):
+    if workers is None:
+        workers = WORKERS
+    if os.path.isdir(csv_file):
+        return read_players_shards(csv_file, player_filter, blacklist_filter, delimiter, workers)
+    return ingest_players_data(csv_file, player_filter, blacklist_filter, delimiter, workers)[0]
+
+def read_players_sources(csv_files, player_filter = None, blacklist_filter = None, delimiter=CSV_DELIMITER):
+    # loads several overlapping exports into one dataset, a row with the
+    # activity id and the metrics key already loaded from the previous
+    # files is skipped
+    if len(csv_files) == 1:
+        return read_players_data(csv_files[0], player_filter, blacklist_filter, delimiter)
+    cache = cache_file('sources', csv_files[0], player_filter, blacklist_filter, delimiter,
+                       [os.path.abspath(f) for f in csv_files])
+    fingerprint = code_fingerprint() + tuple(cache_fingerprint(f)[2:] for f in csv_files)
+    players = load_cache(cache, fingerprint)
+    if players is None:
+        players = {}
+        i = 0
+        for n, csv_file in enumerate(csv_files):
+            print('read from file {}'.format(csv_file))
+            i, _, _ = parse_players_file(players, csv_file, 0, i, player_filter, blacklist_filter,
+                                         delimiter, 1, n > 0)
+        print(i, "lines loaded")
+        save_cache(cache, players, fingerprint)
+    build_players(players, player_filter)
+    return players
+
+# columnar activity store
+
+ACTIVITY_TYPES = ('u', 't', 'f', 'p', 'sp', 'fp', 'sg', 'fg', 'se', 'fe', 's', 'pl_a', 'pl_w', 'pl_l')
+_NO_CODE = -1
+_NO_VALUE = -2 ** 31
+
+# column -> (array type code, default value)
+_COLUMNS = {
+    'player': ('i', 0),
+    'd': ('d', 0.0),
+    'ddate': ('i', 0),
+    'v': ('h', 0),
+    'c': ('q', 0),
+    'i': ('q', 0),
+    't': ('b', _NO_CODE),
+    'l': ('b', _NO_CODE),
+    'u': ('b', _NO_CODE),
+    'p': ('b', _NO_CODE),
+    'w': ('i', _NO_VALUE),
+    'y': ('i', _NO_VALUE),
+    'ac': ('i', _NO_CODE),
+    'ac_dmg': ('d', 0.0),
+    'ac_enm': ('i', 0),
+    'ac_prg': ('i', 0),
+    'ma': ('i', _NO_VALUE),
+    'upg_l': ('i', _NO_VALUE),
+    'heal': ('i', _NO_VALUE),
+    'base': ('i', _NO_VALUE),
+    'enm_be': ('i', _NO_VALUE),
+    'enm_oth': ('i', _NO_VALUE),
+    'pls_t': ('d', float('nan')),
+    'gs_t': ('d', float('nan')),
+    'es_t': ('d', float('nan'))
+}
+
+def _column_value(name):
+    return lambda s, k: int(s.columns[name][k])
+def _column_float(name):
+    return lambda s, k: float(s.columns[name][k])
+def _column_present(name):
+    return lambda s, k: s.columns[name][k] != _NO_VALUE
+def _column_float_present(name):
+    return lambda s, k: s.columns[name][k] == s.columns[name][k]
+
+def _activity_artefact(s, k):
+    art, checksum = s.artefacts[s.columns['ac'][k]]
+    return [art, checksum, float(s.columns['ac_dmg'][k]), int(s.columns['ac_enm'][k]), int(s.columns['ac_prg'][k])]
+
+def _activity_metrics(s, k):
+    # the metrics of the activity rows in the order of the file
+    n = s.columns['src'][k]
+    first = s.metrics_offsets[n]
+    last = s.metrics_offsets[n + 1]
+    keys = s.metrics_keys
+    return {keys[code]: value for code, value in zip(s.metrics_key[first:last].tolist(),
+                                                      s.metrics_value[first:last].tolist())}
+
+# the activity fields available through ActivityView, the same keys as read_players_data produces
+_ACTIVITY_FIELDS = {
+    'v': lambda s, k: s.versions[s.columns['v'][k]],
+    'i': _column_value('i'),
+    'c': _column_value('c'),
+    'd': _column_float('d'),
+    'ddate': lambda s, k: s.days[s.columns['ddate'][k]],
+    'dpydate': lambda s, k: datetime.datetime.fromtimestamp(s.columns['d'][k]),
+    'm': _activity_metrics,
+    't': lambda s, k: ACTIVITY_TYPES[s.columns['t'][k]],
+    'l': lambda s, k: LEVELS[s.columns['l'][k]],
+    'u': lambda s, k: UNITS[s.columns['u'][k]],
+    'p': lambda s, k: TRADITIONS[s.columns['p'][k]],
+    'ac': _activity_artefact,
+    'w': _column_value('w'),
+    'y': _column_value('y'),
+    'ma': _column_value('ma'),
+    'upg_l': _column_value('upg_l'),
+    'heal': _column_value('heal'),
+    'base': _column_value('base'),
+    'enm_be': _column_value('enm_be'),
+    'enm_oth': _column_value('enm_oth'),
+    'pls_t': _column_float('pls_t'),
+    'gs_t': _column_float('gs_t'),
+    'es_t': _column_float('es_t')
+}
+_ACTIVITY_PRESENT = {
+    'l': lambda s, k: s.columns['l'][k] != _NO_CODE,
+    'u': lambda s, k: s.columns['u'][k] != _NO_CODE,
+    'p': lambda s, k: s.columns['p'][k] != _NO_CODE,
+    'ac': lambda s, k: s.columns['ac'][k] != _NO_CODE,
+    'w': _column_present('w'),
+    'y': _column_present('y'),
+    'ma': _column_present('ma'),
+    'upg_l': _column_present('upg_l'),
+    'heal': _column_present('heal'),
+    'base': _column_present('base'),
+    'enm_be': _column_present('enm_be'),
+    'enm_oth': _column_present('enm_oth'),
+    'pls_t': _column_float_present('pls_t'),
+    'gs_t': _column_float_present('gs_t'),
+    'es_t': _column_float_present('es_t')
+}
+
+class ActivityView:
+    # read-only dict-like access to one activity of the columnar store
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        if key in _ACTIVITY_PRESENT and not _ACTIVITY_PRESENT[key](self.store, self.index):
+            raise KeyError(key)
+        return _ACTIVITY_FIELDS[key](self.store, self.index)
+
+    def __contains__(self, key):
+        if key in _ACTIVITY_PRESENT:
+            return bool(_ACTIVITY_PRESENT[key](self.store, self.index))
+        return key in _ACTIVITY_FIELDS
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [k for k in _ACTIVITY_FIELDS if k in self]
+
+    def __repr__(self):
+        return repr({k: self[k] for k in self.keys()})
+
+class PlayerActivities:
+    # the activities of one player: a read-only mapping activity id -> ActivityView
+    __slots__ = ('store', 'start', 'finish')
+
+    def __init__(self, store, start, finish):
+        self.store = store
+        self.start = start
+        self.finish = finish
+
+    def __len__(self):
+        return self.finish - self.start
+
+    def __iter__(self):
+        return iter(self.store.ids[self.start:self.finish])
+
+    def __getitem__(self, activity_id):
+        ids = self.store.ids
+        try:
+            return ActivityView(self.store, ids.index(activity_id, self.start, self.finish))
+        except ValueError:
+            raise KeyError(activity_id)
+
+    def keys(self):
+        return self.store.ids[self.start:self.finish]
+
+    def values(self):
+        return (ActivityView(self.store, k) for k in range(self.start, self.finish))
+
+    def items(self):
+        return ((self.store.ids[k], ActivityView(self.store, k)) for k in range(self.start, self.finish))
+
+class PlayerDatetable:
+    # the datetable of one player of the columnar store, the rows are built
+    # on the first access
+    __slots__ = ('store', 'player', 'rows')
+
+    def __init__(self, store, player):
+        self.store = store
+        self.player = player
+        self.rows = None
+
+    def table(self):
+        if self.rows is None:
+            self.rows = self.store.datetable(self.player)
+        return self.rows
+
+    def __len__(self):
+        n = self.store.player_index[self.player]
+        return int(self.store.offsets[n + 1] - self.store.offsets[n])
+
+    def __iter__(self):
+        return iter(self.table())
+
+    def __getitem__(self, k):
+        return self.table()[k]
+
+class PlayersColumns:
+    # the players' activities as typed arrays sorted by player; the activities of
+    # the n-th player are the rows offsets[n]:offsets[n + 1] of every column;
+    # the metrics of the activities are the key codes and the values grouped
+    # by the activity rows of the file, see _activity_metrics()
+    def __init__(self, players, offsets, columns, ids, versions, days, artefacts,
+                 metrics_keys, metrics_key, metrics_value, metrics_offsets):
+        self.players = players
+        self.player_index = {p: n for n, p in enumerate(players)}
+        self.offsets = offsets
+        self.columns = columns
+        self.ids = ids
+        self.versions = versions
+        self.days = days
+        self.artefacts = artefacts
+        self.metrics_keys = metrics_keys
+        self.metrics_key = metrics_key
+        self.metrics_value = metrics_value
+        self.metrics_offsets = metrics_offsets
+        self.sessions = [[] for _ in players]
+        self.datetables = [PlayerDatetable(self, p) for p in players]
+
+    def __len__(self):
+        return len(self.players)
+
+    def __iter__(self):
+        return iter(self.players)
+
+    def __contains__(self, player):
+        return player in self.player_index
+
+    def __getitem__(self, player):
+        n = self.player_index[player]
+        return (PlayerActivities(self, int(self.offsets[n]), int(self.offsets[n + 1])),
+                self.datetables[n], self.sessions[n])
+
+    def keys(self):
+        return self.players
+
+    def items(self):
+        return ((p, self[p]) for p in self.players)
+
+    def datetable(self, player):
+        n = self.player_index[player]
+        d = self.columns['d']
+        c = self.columns['c']
+        i = self.columns['i']
+        return [[float(d[k]), int(c[k]), int(i[k]), ActivityView(self, k)]
+                for k in range(self.offsets[n], self.offsets[n + 1])]
+
+    def player_column(self):
+        return numpy.repeat(numpy.arange(len(self.players), dtype=numpy.int32), numpy.diff(self.offsets))
+
+def read_players_columns(csv_file, player_filter = None, blacklist_filter = None, delimiter=CSV_DELIMITER):
+    if numpy is None:
+        print('Cannot build the columnar store: NumPy is not available')
+        exit(1)
+    cache = cache_file('columns', csv_file, player_filter, blacklist_filter, delimiter)
+    players = load_cache(cache)
+    if players is not None:
+        return players
+    print('read from file {}'.format(csv_file))
+    columns = {name: array.array(code) for name, (code, _) in _COLUMNS.items()}
+    defaults = [(columns[name].append, default) for name, (_, default) in _COLUMNS.items()]
+    col_player = columns['player']
+    col_d = columns['d']
+    col_ddate = columns['ddate']
+    col_v = columns['v']
+    col_c = columns['c']
+    col_i = columns['i']
+    col_t = columns['t']
+    col_l = columns['l']
+    col_u = columns['u']
+    col_p = columns['p']
+    col_w = columns['w']
+    col_ac = columns['ac']
+    players = []
+    player_index = {}
+    versions = []
+    version_index = {}
+    days = []
+    day_index = {}
+    artefacts = []
+    ids = []
+    activity_index = {}
+    contexts = {}
+    # the metrics rows: the activity, the key code and the value
+    metrics_keys = []
+    metrics_key_index = {}
+    col_m_act = array.array('q')
+    col_m_key = array.array('h')
+    col_m_value = array.array('d')
+    f_code = ACTIVITY_TYPES.index('f')
+    p_code = ACTIVITY_TYPES.index('p')
+
+    the_file = open_data_file(csv_file)
+    lines = the_file
+    if player_filter or blacklist_filter:
+        lines = PlayerLineFilter(the_file, player_filter, blacklist_filter, delimiter)
+    reader = csv.reader(lines, delimiter=delimiter)
+    i = 0
+    for row in reader:
+        i += 1
+        if len(row) != _CSV_SIZE:
+            print("Cannot read players' database from CSV: bad row {}".format(i))
+            exit(1)
+        if row[_CSV_ID] == 'id':
+            # skip header
+            continue
+        if len(row[_CSV_METRICS_ID]) == 0:
+            # skip empty metrics
+            continue
+
+        player_id = row[_CSV_PLAYER]
+        if player_filter:
+            if player_id not in player_filter:
+                continue
+        if blacklist_filter:
+            if player_id in blacklist_filter:
+                continue
+
+        app_version = row[_CSV_APP_VERSION]
+        if FILTER_VERSION is not None and app_version == FILTER_VERSION:
+            continue
+
+        try:
+            d, d_date, _ = parse_datetime(row[_CSV_DATETIME])
+        except ValueError:
+            print("Cannot read players' database from CSV: bad data {} at row {}".format(row[_CSV_DATETIME], i))
+            continue
+
+        activity_id = row[_CSV_ID]
+        k = activity_index.get(activity_id)
+        if k is None:
+            k = len(ids)
+            activity_index[activity_id] = k
+            ids.append(activity_id)
+            for append, default in defaults:
+                append(default)
+            if player_id not in player_index:
+                player_index[player_id] = len(players)
+                players.append(player_id)
+            col_player[k] = player_index[player_id]
+            col_d[k] = d
+            if d_date not in day_index:
+                day_index[d_date] = len(days)
+                days.append(d_date)
+            col_ddate[k] = day_index[d_date]
+            context = row[_CSV_CONTEXT]
+            if context not in contexts:
+                act_type, level, unit, tradition = decode_context(context, i)
+                contexts[context] = (ACTIVITY_TYPES.index(act_type),
+                                     _NO_CODE if level is None else LEVELS.index(level),
+                                     _NO_CODE if unit is None else UNITS.index(unit),
+                                     _NO_CODE if tradition is None else TRADITIONS.index(tradition))
+            col_t[k], col_l[k], col_u[k], col_p[k] = contexts[context]
+            if col_u[k] != _NO_CODE and len(row[_CSV_ARTEFACT]) > 0:
+                col_ac[k] = len(artefacts)
+                artefacts.append((row[_CSV_ARTEFACT], row[_CSV_CHECKSUM]))
+
+        if app_version not in version_index:
+            version_index[app_version] = len(versions)
+            versions.append(app_version)
+        col_v[k] = version_index[app_version]
+        col_i[k] = int(row[_CSV_METRICS_ID])
+
+        metrics_key = row[_CSV_METRICS_KEY]
+        metrics_value = float(row[_CSV_METRICS_VALUE])
+        act_type = col_t[k]
+        if metrics_key not in metrics_key_index:
+            metrics_key_index[metrics_key] = len(metrics_keys)
+            metrics_keys.append(metrics_key)
+        col_m_act.append(k)
+        col_m_key.append(metrics_key_index[metrics_key])
+        col_m_value.append(metrics_value)
 
         if metrics_key == 'creation_index':
-            index = int(metrics_value)
-            a['c'] = index
-            #players[player_id][1][-1][1] = index
-        elif 'c' not in a:
-            a['c'] = 0
-
-        if metrics_key == 'try' and a['t'] == 'f':
-            a['y'] = int(metrics_value)
-        elif metrics_key == 'level' and a['t'] == 'f':
+            col_c[k] = int(metrics_value)
+
+        if metrics_key == 'try' and act_type == f_code:
+            columns['y'][k] = int(metrics_value)
+        elif metrics_key == 'level' and act_type == f_code:
             level = int(metrics_value)
             if level < 0 or level >= len(LEVELS):
                 print("Bad final level {} at row {}".format(level, i))
                 level = len(LEVELS) - 1
-            a['l'] = LEVELS[level]
-        elif (metrics_key == 'last_wave' or metrics_key == 'wave') and 'w' not in a:
-            a['w'] = int(metrics_value) + 1
+            col_l[k] = level
+        elif (metrics_key == 'last_wave' or metrics_key == 'wave') and col_w[k] == _NO_VALUE:
+            col_w[k] = int(metrics_value) + 1
         elif metrics_key == 'drone_damage':
-            if 'ac' in a:
-                a['ac'][2] += metrics_value
+            if col_ac[k] != _NO_CODE:
+                columns['ac_dmg'][k] += metrics_value
         elif metrics_key == 'enemies_destroyed':
-            if 'ac' in a:
-                a['ac'][3] += int(metrics_value)
+            if col_ac[k] != _NO_CODE:
+                columns['ac_enm'][k] += int(metrics_value)
         elif metrics_key == 'manual_activation':
-            a['ma'] = int(metrics_value)
+            columns['ma'][k] = int(metrics_value)
         elif metrics_key == 'program_activation':
-            if 'ac' in a:
-                a['ac'][4] += int(metrics_value)            
+            if col_ac[k] != _NO_CODE:
+                columns['ac_prg'][k] += int(metrics_value)
         elif metrics_key == 'upgradeLevel':
-            a['upg_l'] = int(metrics_value)
+            columns['upg_l'][k] = int(metrics_value)
         elif metrics_key == 'health_left':
-            a['heal'] = int(metrics_value)
+            columns['heal'][k] = int(metrics_value)
         elif metrics_key == 'placement_time':
-            a['pls_t'] = metrics_value
+            columns['pls_t'][k] = metrics_value
         elif metrics_key == 'session_time':
-            a['gs_t'] = metrics_value
+            columns['gs_t'][k] = metrics_value
         elif metrics_key == 'editing_time':
-            a['es_t'] = metrics_value
-        elif a['t'] == 'p' and metrics_key.find('_count') > 0:
+            columns['es_t'][k] = metrics_value
+        elif act_type == p_code and metrics_key.find('_count') > 0:
             if metrics_key.find('beetle') == 0:
-                a['enm_be'] = int(metrics_value)
+                columns['enm_be'][k] = int(metrics_value)
             else:
-                a['enm_oth'] = int(metrics_value)
+                columns['enm_oth'][k] = int(metrics_value)
         elif metrics_key.find('base_health_left') == 0:
-            a['base'] = int(metrics_value)
+            columns['base'][k] = int(metrics_value)
+    the_file.close()
+    if lines is not the_file:
+        i += lines.skipped
+    del activity_index
+
+    for name in columns:
+        columns[name] = numpy.frombuffer(columns[name], dtype=columns[name].typecode)
+    # the activities keep their row of the file to find their metrics
+    columns['src'] = numpy.arange(len(ids), dtype=numpy.int64)
+    col_m_act = numpy.frombuffer(col_m_act, dtype=col_m_act.typecode)
+    metrics_order = numpy.argsort(col_m_act, kind='stable')
+    col_m_key = numpy.frombuffer(col_m_key, dtype=col_m_key.typecode)[metrics_order]
+    col_m_value = numpy.frombuffer(col_m_value, dtype=col_m_value.typecode)[metrics_order]
+    metrics_offsets = numpy.zeros(len(ids) + 1, dtype=numpy.int64)
+    metrics_offsets[1:] = numpy.cumsum(numpy.bincount(col_m_act, minlength=len(ids)))
+    del col_m_act, metrics_order
+    order = numpy.argsort(columns['player'], kind='stable')
+    offsets = numpy.zeros(len(players) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum(numpy.bincount(columns['player'], minlength=len(players)))
 
     # split multi-players
-    if player_filter:
-        to_delete = set([])
-        to_add = {}
-        for pl, pl_values in players.items():
-            if player_filter[pl] is None:
-                continue
+    segments = []
+    packed = {}
+    for n, pl in enumerate(players):
+        rows = order[offsets[n]:offsets[n + 1]]
+        split = False
+        if player_filter and player_filter[pl] is not None:
+            cindexes = columns['c'][rows]
+            cindexes_order = numpy.argsort(cindexes, kind='stable')
+            sorted_cindexes = cindexes[cindexes_order]
             for indexes in player_filter[pl]:
                 if indexes is None: continue
                 first_index, last_index = indexes
-                activities, _, _ = pl_values
-                for aid, a in activities.items():
-                    if first_index <= a['c'] <= last_index:
-                        new_player = pack_player(pl, first_index)
-                        to_delete.add(pl)
-                        if new_player not in to_add:
-                            to_add[new_player] = {}
-                        to_add[new_player][aid] = a
-        for p in to_delete:
-            del players[p]
-        for p, v in to_add.items():
-            players[p] = (v, [], [])
-    the_file.close()
-
-    # build date table
-    for pl, pl_values in players.items():
-        activities, datetable, _ = pl_values
-        for a in activities.values():
-            datetable.append([a['d'], a['c'], a['i'], a])
+                lo = numpy.searchsorted(sorted_cindexes, first_index, 'left')
+                hi = numpy.searchsorted(sorted_cindexes, last_index, 'right')
+                if lo >= hi:
+                    continue
+                mask = numpy.zeros(len(rows), dtype=bool)
+                mask[cindexes_order[lo:hi]] = True
+                split = True
+                new_player = pack_player(pl, first_index)
+                if new_player in packed:
+                    mask = mask | packed[new_player][1]
+                packed[new_player] = (rows, mask)
+        if not split:
+            segments.append((pl, rows))
+    for new_player, (rows, mask) in packed.items():
+        segments.append((new_player, rows[mask]))
+
+    players = [pl for pl, _ in segments]
+    offsets = numpy.zeros(len(segments) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum([len(rows) for _, rows in segments])
+    if len(segments) > 0:
+        order = numpy.concatenate([rows for _, rows in segments])
+    else:
+        order = numpy.zeros(0, dtype=numpy.int64)
+    del columns['player']
+    for name in columns:
+        columns[name] = columns[name][order]
+    ids = [ids[k] for k in order]
 
     print(i, "lines loaded")
+    players = PlayersColumns(players, offsets, columns, ids, versions, days, artefacts,
+                             metrics_keys, col_m_key, col_m_value, metrics_offsets)
+    save_cache(cache, players)
     return players
 
-def read_players_sessions(csv_file, player_filter=None, print_sessions=False, delimiter=','):
-    players = read_players_data(csv_file, player_filter, None, delimiter)
-    print('reconstruct sessions...')
-    
-    def avg_sum_session(session):
-        total_tries = 0
-        total_units = 0
-        total_progs = 0
-        avg_units = 0.0
-        avg_progs = 0.0
-        avg_dmg = 0.0
-        avg_bee = 0
-        avg_bugs = 0
-        avg_wons = 0
-        for w, tries in session['ws'].items():
-            for t, v in tries.items():
-                units, progs, dmg, bee, bugs, wons = v
-                if units == 0:
-                    continue
-                total_tries += 1
-                total_units += units
-                total_progs += progs
-                avg_units += units
-                avg_progs += float(progs) / units
-                avg_dmg += dmg / units
-                avg_bee += bee
-                avg_bugs += bugs
-                avg_wons += wons
-        if total_tries > 0:
-            avg_units /= float(total_tries)
-            avg_progs /= float(total_tries)
-            avg_dmg /= float(total_tries)
-            avg_bee /= float(total_tries)
-            avg_wons /= float(total_tries)
-        session['tries'] = total_tries
-        session['units'] = total_units
-        session['punits'] = total_progs
-        session['avg_u'] = avg_units
-        session['avg_p'] = avg_progs
-        session['avg_d'] = avg_dmg
-        session['avg_bee'] = avg_bee
-        session['avg_bugs'] = avg_bugs
-        session['avg_wons'] = avg_wons
-        total_gs = 0.0
-        total_pls = 0.0
-        total_es = 0.0
-        if len(session['gs']) > 0:
-            for t in session['gs']:
-                total_gs += t
-            total_gs /= len(session['gs'])
-        else:
-            diff = session['fd'] - session['sd']
-            if diff < _MAX_SESSION_LENGTH:
-                total_gs = diff
-        session['avg_gs'] = total_gs
-        session['avg_es'] = 0.0
-        if len(session['es']) > 0:
-            total_es = sum(session['es'])
-            session['avg_es'] = total_es / len(session['es'])
-        session['edits'] = total_es
-        session['avg_pls'] = 0.0
-        if len(session['pls']) > 0:
-            total_pls = sum(session['pls'])
-            session['avg_pls'] = total_pls / len(session['pls'])
-        session['places'] = total_pls - total_es
+def session_tries_stats(session):
+    total_tries = 0
+    total_units = 0
+    total_progs = 0
+    avg_units = 0.0
+    avg_progs = 0.0
+    avg_dmg = 0.0
+    avg_bee = 0
+    avg_bugs = 0
+    avg_wons = 0
+    for w, tries in session.ws.items():
+        for t, v in tries.items():
+            units, progs, dmg, bee, bugs, wons = v
+            if units == 0:
+                continue
+            total_tries += 1
+            total_units += units
+            total_progs += progs
+            avg_units += units
+            avg_progs += float(progs) / units
+            avg_dmg += dmg / units
+            avg_bee += bee
+            avg_bugs += bugs
+            avg_wons += wons
+    if total_tries > 0:
+        avg_units /= float(total_tries)
+        avg_progs /= float(total_tries)
+        avg_dmg /= float(total_tries)
+        avg_bee /= float(total_tries)
+        avg_wons /= float(total_tries)
+    session.tries = total_tries
+    session.units = total_units
+    session.punits = total_progs
+    session.avg_u = avg_units
+    session.avg_p = avg_progs
+    session.avg_d = avg_dmg
+    session.avg_bee = avg_bee
+    session.avg_bugs = avg_bugs
+    session.avg_wons = avg_wons
+
+def session_games_stats(session):
+    total_gs = 0.0
+    if len(session.gs) > 0:
+        for t in session.gs:
+            total_gs += t
+        total_gs /= len(session.gs)
+    else:
+        diff = session.fd - session.sd
+        if diff < _MAX_SESSION_LENGTH:
+            total_gs = diff
+    session.avg_gs = total_gs
+
+def session_editing_stats(session):
+    total_es = 0.0
+    session.avg_es = 0.0
+    if len(session.es) > 0:
+        total_es = sum(session.es)
+        session.avg_es = total_es / len(session.es)
+    session.edits = total_es
+
+def session_placement_stats(session):
+    total_pls = 0.0
+    session.avg_pls = 0.0
+    if len(session.pls) > 0:
+        total_pls = sum(session.pls)
+        session.avg_pls = total_pls / len(session.pls)
+    total_es = 0.0
+    if len(session.es) > 0:
+        total_es = sum(session.es)
+    session.places = total_pls - total_es
+
+# session aggregate -> the function calculating it with its group
+SESSION_AGGREGATES = {
+    'tries': session_tries_stats,
+    'units': session_tries_stats,
+    'punits': session_tries_stats,
+    'avg_u': session_tries_stats,
+    'avg_p': session_tries_stats,
+    'avg_d': session_tries_stats,
+    'avg_bee': session_tries_stats,
+    'avg_bugs': session_tries_stats,
+    'avg_wons': session_tries_stats,
+    'avg_gs': session_games_stats,
+    'avg_es': session_editing_stats,
+    'edits': session_editing_stats,
+    'avg_pls': session_placement_stats,
+    'places': session_placement_stats
+}
 
-    for player, values in players.items():
-        activities, datetable, sessions = values
+def avg_sum_session(session):
+    for calc in dict.fromkeys(SESSION_AGGREGATES.values()):
+        calc(session)
+
+def finish_session(session):
+    # the session is complete: keep the per-wave stats compact, the
+    # aggregates are calculated on the first access
+    session.ws = {w: {t: tuple(v) for t, v in tries.items()} for w, tries in session.ws.items()}
+
+def reconstruct_player_sessions(datetable, sessions, start_game = None):
+    cur_session = None
+    cur_try = 1
+    cur_start_game = start_game
+    cur_games = []
+    cur_placements = []
+    cur_editings = []
+    pre_sd = pre_smid = pre_sidx = None
+
+    for d, cindex, metrics_id, a in sorted(datetable, key = lambda x: (x[1], x[2], x[0])):
+        if cindex == 0 and a['v'].find('1.5.3') == 0:
+            print('bad creation index for modern AD version: {}', a)
+            exit(1)
+        act_type = a['t']
+        tradition = a['p'] if act_type == 't' or act_type == 'f' else None
 
-        cur_session = None
-        cur_try = 1
-        cur_start_game = None
-        cur_games = []
-        cur_placements = []
-        cur_editings = []
-        pre_sd = pre_smid = pre_sidx = None
+        save = 0
+        platform = None
+        if act_type in ('fp', 'sg', 'fg', 'fe', 's', 'pl_a', 'pl_w', 'pl_l'):
+            
+            if pre_sd is None:
+                pre_sd = d
+            if pre_smid is None:
+                pre_smid = metrics_id
+            if pre_sidx is None:
+                pre_sidx = cindex
+
+            if act_type == 'fp':
+                cur_placements.append(a['pls_t'])
+            elif act_type == 'sg':
+                cur_start_game = d
+            elif act_type == 'fg':
+                cur_games.append(a['gs_t'])
+                cur_start_game = None
+            elif act_type == 'fe':
+                cur_editings.append(a['es_t'])
+            elif act_type == 's':
+                save = 1
+            elif act_type == 'pl_a':
+                platform = 'android'
+            elif act_type == 'pl_w':
+                platform = 'windows'
+            elif act_type == 'pl_l':
+                platform = 'linux'
+        
+        if cur_session is not None:
+            cur_session.v.add(a['v'])
 
-        for d, cindex, metrics_id, a in sorted(datetable, key = lambda x: (x[1], x[2], x[0])):
-            if cindex == 0 and a['v'].find('1.5.3') == 0:
-                print('bad creation index for modern AD version: {}', a)
-                exit(1)
-            act_type = a['t']
-            tradition = a['p'] if act_type == 't' or act_type == 'f' else None
+            if platform is not None:
+                if not hasattr(cur_session, 'plat'):
+                    cur_session.plat = set([platform])
+                else:
+                    cur_session.plat.add(platform)
 
-            save = 0
-            platform = None
-            if act_type in ('fp', 'sg', 'fg', 'fe', 's', 'pl_a', 'pl_w', 'pl_l'):
-                
-                if pre_sd is None:
+        if 'ma' in a:
+            manual = a['ma']
+        else:
+            manual = 0
+
+        if act_type == 'p' and cur_session is not None:
+            tries = cur_session.ws[cur_session.w]
+            max_try = max(tries.keys())
+            if 'enm_be' in a:
+                tries[max_try][3] += a['enm_be']
+            if 'enm_oth' in a:
+                tries[max_try][3] += a['enm_oth']
+
+        if act_type in ('f', 'u', 't'):
+            level = a['l']
+            if 'w' not in a: 
+                continue
+            wave = a['w']
+            version = a['v']
+        
+            unit = a['u'] if a['t'] == 'u' else None
+            art_cs = a['ac'] if 'ac' in a else None
+
+            if cur_session is not None and wave not in cur_session.ws:
+                cur_try = 1
+                cur_session.ws[wave] = {cur_try: [0, 0, 0.0, 0, 0, 0]}
+            
+            if cur_session is not None and level == cur_session.l and wave >= cur_session.w:
+                if unit is not None:
+                    if unit not in cur_session.u:
+                        cur_session.u.append(unit)
+                    if art_cs is not None:
+                        cur_session.art[art_cs[0]] = (unit, art_cs[2], art_cs[3], d, version)
+                        #else:
+                        #    print('program {} is already in session, orig: {}'.format(art_cs[0], cur_session.art[art_cs[1]]))
+                        cur_session.ws[wave][cur_try][1] += 1
+                        if not hasattr(cur_session, 'wp'):
+                            cur_session.wp = wave
+                    cur_session.ws[wave][cur_try][0] += 1
+                    if 'drone_damage' in a['m']: 
+                        cur_session.ws[wave][cur_try][2] += a['m']['drone_damage']
+                    cur_session.ma += manual
+                if tradition is not None and cur_session.t is None:
+                    cur_session.t = tradition
+                if act_type == 'f' and a['y'] > cur_try:
+                    cur_try += 1
+                    cur_session.ws[wave][cur_try] = [0, 0, 0.0, 0, 0, int(a['base'] == 10)]
+                cur_session.w = wave
+                cur_session.a.append(a)
+                if d > cur_session.fd:
+                    cur_session.fd = d
+                cur_session.sa += save
+            else:
+                if cur_session is not None:
+                    cur_session.gs = cur_games
+                    if cur_start_game is not None:
+                        cur_session.gs.append(cur_session.fd - cur_start_game)
+                    cur_session.pls = cur_placements
+                    cur_session.es = cur_editings
+                    cur_games = []
+                    cur_placements = []
+                    cur_editings = []
+                    finish_session(cur_session)
+                    sessions.append(cur_session)
+
+                if len(sessions) > 0:
                     pre_sd = d
-                if pre_smid is None:
                     pre_smid = metrics_id
-                if pre_sidx is None:
                     pre_sidx = cindex
-
-                if act_type == 'fp':
-                    cur_placements.append(a['pls_t'])
-                elif act_type == 'sg':
-                    cur_start_game = d
-                elif act_type == 'fg':
-                    cur_games.append(a['gs_t'])
-                    cur_start_game = None
-                elif act_type == 'fe':
-                    cur_editings.append(a['es_t'])
-                elif act_type == 's':
-                    save = 1
-                elif act_type == 'pl_a':
-                    platform = 'android'
-                elif act_type == 'pl_w':
-                    platform = 'windows'
-                elif act_type == 'pl_l':
-                    platform = 'linux'
-            
+                cur_try = 1
+                if 'base' not in a:
+                    base = 0
+                else:
+                    base = int(a['base'] == 10)
+                cur_session = Session(v=set([a['v']]), l=level, w=wave, ws={wave: {cur_try: [0, 0, 0.0, 0, 0, base]}},
+                                      sd=d if pre_sd is None else pre_sd, fd=d,
+                                      smid=metrics_id if pre_smid is None else pre_smid, fmid=metrics_id,
+                                      sidx=cindex if pre_sidx is None else pre_sidx, fidx=cindex,
+                                      a=[a], u=[], t=tradition, art={}, gs=[], pls=[], es=[], sa=save,
+                                      ma=manual)
+                if unit is not None:
+                    cur_session.u.append(unit)
+                    cur_session.ws[wave][cur_try][0] += 1
+                    if art_cs is not None:
+                        cur_session.art[art_cs[0]] = (unit, art_cs[2], art_cs[3], d, version)
+                        cur_session.ws[wave][cur_try][1] += 1
+                        cur_session.wp = wave
+                    if 'drone_damage' in a['m']:
+                        cur_session.ws[wave][cur_try][2] += a['m']['drone_damage']
+        else:
             if cur_session is not None:
-                cur_session['v'].add(a['v'])
-
-                if platform is not None:
-                    if 'plat' not in cur_session:
-                        cur_session['plat'] = set([platform])
-                    else:
-                        cur_session['plat'].add(platform)
+                cur_session.sa += save
+                save = 0
+                if d > cur_session.fd:
+                    cur_session.fd = d
+                if metrics_id > cur_session.fmid:
+                    cur_session.fmid = metrics_id
+                if cindex > cur_session.fidx:
+                    cur_session.fidx = cindex
+
+    if cur_session is not None:
+        cur_session.sa += save
+        save = 0
+        if d > cur_session.fd:
+            cur_session.fd = d
+        if metrics_id > cur_session.fmid:
+            cur_session.fmid = metrics_id
+        if cindex > cur_session.fidx:
+            cur_session.fidx = cindex
+        cur_session.gs = cur_games
+        if cur_start_game is not None:
+            cur_session.gs.append(cur_session.fd - cur_start_game)
+        cur_session.pls = cur_placements
+        cur_session.es = cur_editings
+        cur_games = []
+        cur_placements = []
+        cur_editings = []
+        finish_session(cur_session)
+        sessions.append(cur_session)
+
+# activity type codes of the vectorized sessions reconstruction, the codes
+# of the session activities and of the session start activities are ranges
+_SESSION_F = 1
+_SESSION_U = 2
+_SESSION_T = 3
+_SESSION_FP = 4
+_SESSION_SG = 5
+_SESSION_FG = 6
+_SESSION_FE = 7
+_SESSION_S = 8
+_SESSION_PL_A = 9
+_SESSION_PL_W = 10
+_SESSION_PL_L = 11
+_SESSION_P = 12
+_SESSION_TYPES = {
+    'f': _SESSION_F,
+    'u': _SESSION_U,
+    't': _SESSION_T,
+    'fp': _SESSION_FP,
+    'sg': _SESSION_SG,
+    'fg': _SESSION_FG,
+    'fe': _SESSION_FE,
+    's': _SESSION_S,
+    'pl_a': _SESSION_PL_A,
+    'pl_w': _SESSION_PL_W,
+    'pl_l': _SESSION_PL_L,
+    'p': _SESSION_P
+}
+_SESSION_PLATFORMS = {_SESSION_PL_A: 'android', _SESSION_PL_W: 'windows', _SESSION_PL_L: 'linux'}
+
+def session_reduce(ufunc, values, starts, finishes, initial):
+    # ufunc over the rows [start, finish) of every session
+    bounds = numpy.stack((starts, finishes), axis=1).ravel()
+    return ufunc.reduceat(numpy.append(values, initial), bounds)[::2]
+
+def session_lists(sessions, values, n):
+    # split the values sorted by the session index into the per session lists
+    bounds = numpy.searchsorted(sessions, numpy.arange(n + 1)).tolist()
+    return [values[bounds[k]:bounds[k + 1]] for k in range(n)]
+
+def reconstruct_players_sessions(players):
+    # reconstruct_player_sessions() for all the players at once: the session
+    # boundaries and the tries are calculated on the arrays of the sorted
+    # activities, the activities are read only once to build them; the
+    # aggregates are left to the first access as for the other sessions
+    sizes = []
+    table = []
+    for _, datetable, _ in players.values():
+        sizes.append(len(datetable))
+        table.extend(datetable)
+    n = len(table)
+    if n == 0:
+        return
+    offsets = numpy.zeros(len(sizes) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum(sizes)
+    player = numpy.repeat(numpy.arange(len(sizes)), sizes)
+    d = numpy.array(list(map(operator.itemgetter(0), table)), dtype=numpy.float64)
+    c = numpy.array(list(map(operator.itemgetter(1), table)), dtype=numpy.int64)
+    mid = numpy.array(list(map(operator.itemgetter(2), table)), dtype=numpy.int64)
+    order = numpy.lexsort((d, mid, c, player))
+    d = d[order]
+    c = c[order]
+    mid = mid[order]
+    acts = [table[k][3] for k in order.tolist()]
+    del table
+
+    versions = list(map(operator.attrgetter('v'), acts))
+    for k in numpy.flatnonzero(c == 0).tolist():
+        if versions[k].find('1.5.3') == 0:
+            print('bad creation index for modern AD version: {}', acts[k])
+            exit(1)
+    code = numpy.array(list(map(_SESSION_TYPES.get, map(operator.attrgetter('t'), acts), itertools.repeat(0))),
+                       dtype=numpy.int8)
+
+    # the game activities: levels and waves define the sessions
+    ftu = numpy.flatnonzero((code >= _SESSION_F) & (code <= _SESSION_T)).tolist()
+    g = numpy.array([k for k in ftu if hasattr(acts[k], 'w')], dtype=numpy.int64)
+    if len(g) == 0:
+        return
+    skipped = numpy.zeros(n, dtype=bool)
+    skipped[ftu] = True
+    skipped[g] = False
+    gacts = list(map(acts.__getitem__, g.tolist()))
+    gcode = code[g]
+    wave = numpy.array(list(map(operator.attrgetter('w'), gacts)), dtype=numpy.int64)
+    level_codes = {}
+    level = numpy.array([level_codes.setdefault(a.l, len(level_codes)) for a in gacts], dtype=numpy.int64)
+    start = numpy.ones(len(g), dtype=bool)
+    start[1:] = (player[g[1:]] != player[g[:-1]]) | (level[1:] != level[:-1]) | (wave[1:] < wave[:-1])
+    gsession = numpy.cumsum(start) - 1
+    gstart = numpy.flatnonzero(start)
+    gfinish = numpy.append(gstart[1:], len(g))
+
+    starts = g[gstart]
+    ns = len(starts)
+    splayer = player[starts]
+    finishes = numpy.minimum(numpy.append(starts[1:], n), offsets[splayer + 1])
+    first = numpy.ones(ns, dtype=bool)
+    first[1:] = splayer[1:] != splayer[:-1]
+    last = numpy.ones(ns, dtype=bool)
+    last[:-1] = splayer[1:] != splayer[:-1]
+    rows = numpy.arange(n)
+    rsession = numpy.searchsorted(starts, rows, 'right') - 1
+    insession = (rsession >= 0) & (rows < finishes[numpy.maximum(rsession, 0)])
+
+    # the first session of the player starts at the first game, placement,
+    # editing, save or platform activity if it precedes the game activities
+    srow = starts.copy()
+    special = numpy.flatnonzero((code >= _SESSION_FP) & (code <= _SESSION_PL_L))
+    if len(special) > 0:
+        k = numpy.searchsorted(special, offsets[splayer[first]])
+        earlier = special[numpy.minimum(k, len(special) - 1)]
+        srow[first] = numpy.where((k < len(special)) & (earlier < starts[first]), earlier, starts[first])
+    sd = d[srow]
+    # the session finish: the game activities are not used for the metrics
+    # id and the creation index, the last activity of the player is always used
+    fd = session_reduce(numpy.maximum, numpy.where(skipped, -numpy.inf, d), starts, finishes, -numpy.inf)
+    excluded = skipped.copy()
+    excluded[g] = True
+    excluded[starts] = False
+    lowest = numpy.iinfo(numpy.int64).min
+    fmid = session_reduce(numpy.maximum, numpy.where(excluded, lowest, mid), starts, finishes, lowest)
+    fidx = session_reduce(numpy.maximum, numpy.where(excluded, lowest, c), starts, finishes, lowest)
+    tail = finishes[last] - 1
+    fd[last] = numpy.maximum(fd[last], d[tail])
+    fmid[last] = numpy.maximum(fmid[last], mid[tail])
+    fidx[last] = numpy.maximum(fidx[last], c[tail])
+
+    # the tries: a new wave starts the first try, the finish activity
+    # with a greater try number starts the next one
+    new_wave = numpy.zeros(len(g), dtype=bool)
+    new_wave[1:] = ~start[1:] & (wave[1:] != wave[:-1])
+    opened = start | new_wave
+    segment = numpy.cumsum(opened) - 1
+    inc = numpy.zeros(len(g), dtype=numpy.int64)
+    finished = numpy.flatnonzero((gcode == _SESSION_F) & ~start)
+    cur_segment = -1
+    cur_try = 1
+    for k, s in zip(finished.tolist(), segment[finished].tolist()):
+        if s != cur_segment:
+            cur_segment = s
+            cur_try = 1
+        if gacts[k].y > cur_try:
+            cur_try += 1
+            inc[k] = 1
+    cinc = numpy.cumsum(inc)
+    try_after = 1 + cinc - (cinc - inc)[opened][segment]
+
+    # the start of a session adds an empty try to the previous session
+    # if the wave is new for it
+    wbase = int(wave.min())
+    wsize = int(wave.max()) - wbase + 1
+    keys = gsession * wsize + wave - wbase
+    query = keys[gstart] - wsize
+    k = numpy.minimum(numpy.searchsorted(keys, query), len(keys) - 1)
+    phantom = ~first & (keys[k] != query)
+
+    # the per-try counters are indexed by the tries in the order of creation
+    created = opened.astype(numpy.int64) + inc
+    created[gstart] += phantom
+    group_after = numpy.cumsum(created) - 1
+    group_before = group_after - inc
+    ngroups = int(group_after[-1]) + 1
+    grp_session = numpy.zeros(ngroups, dtype=numpy.int64)
+    grp_wave = numpy.zeros(ngroups, dtype=numpy.int64)
+    grp_try = numpy.ones(ngroups, dtype=numpy.int64)
+    grp_wons = numpy.zeros(ngroups, dtype=numpy.int64)
+    based = numpy.flatnonzero(start | (inc > 0))
+    base = numpy.array([getattr(gacts[k], 'base', None) == 10 for k in based.tolist()], dtype=numpy.int64)
+    for k, groups in ((numpy.flatnonzero(opened), group_before), (numpy.flatnonzero(inc), group_after)):
+        grp_session[groups[k]] = gsession[k]
+        grp_wave[groups[k]] = wave[k]
+    k = numpy.flatnonzero(inc)
+    grp_try[group_after[k]] = try_after[k]
+    grp_wons[numpy.where(start[based], group_before[based], group_after[based])] = base
+    phantoms = gstart[phantom]
+    grp_session[group_before[phantoms] - 1] = gsession[phantoms] - 1
+    grp_wave[group_before[phantoms] - 1] = wave[phantoms]
+
+    units = numpy.flatnonzero(gcode == _SESSION_U)
+    unit_acts = list(map(gacts.__getitem__, units.tolist()))
+    unit_names = list(map(operator.attrgetter('u'), unit_acts))
+    if None in unit_names:
+        units = units[[u is not None for u in unit_names]]
+        unit_acts = list(map(gacts.__getitem__, units.tolist()))
+        unit_names = list(map(operator.attrgetter('u'), unit_acts))
+    unit_cs = [getattr(a, 'ac', None) for a in unit_acts]
+    programmed = numpy.array([cs is not None for cs in unit_cs], dtype=bool)
+    damage = list(map(dict.get, map(operator.attrgetter('m'), unit_acts), itertools.repeat('drone_damage')))
+    damaged = numpy.array([x is not None for x in damage], dtype=bool)
+    damage = [x for x in damage if x is not None]
+    grp_units = numpy.bincount(group_before[units], minlength=ngroups)
+    grp_punits = numpy.bincount(group_before[units[programmed]], minlength=ngroups)
+    # bincount() of no values is an integer array
+    grp_dmg = numpy.bincount(group_before[units[damaged]], weights=damage, minlength=ngroups).astype(numpy.float64)
+    polygons = numpy.flatnonzero((code == _SESSION_P) & insession)
+    enemies = [getattr(acts[k], 'enm_be', 0) + getattr(acts[k], 'enm_oth', 0) for k in polygons.tolist()]
+    polygons = group_after[numpy.searchsorted(g, polygons, 'right') - 1]
+    grp_bee = numpy.bincount(polygons, weights=enemies, minlength=ngroups).astype(numpy.int64)
+
+    # the game, placement and editing times are collected since the
+    # previous session finish, an unfinished game lasts till the session finish
+    window = starts.copy()
+    window[first] = offsets[splayer[first]]
+    times = {}
+    for t, field in ((_SESSION_FG, 'gs_t'), (_SESSION_FP, 'pls_t'), (_SESSION_FE, 'es_t')):
+        trows = numpy.flatnonzero(code == t)
+        tsession = numpy.searchsorted(window, trows, 'right') - 1
+        inwindow = (tsession >= 0) & (trows < finishes[numpy.maximum(tsession, 0)])
+        trows = trows[inwindow]
+        tsession = tsession[inwindow]
+        times[t] = session_lists(tsession, [getattr(acts[k], field) for k in trows.tolist()], ns)
+    games = numpy.flatnonzero((code == _SESSION_SG) | (code == _SESSION_FG))
+    unfinished = numpy.zeros(ns, dtype=bool)
+    game_time = numpy.zeros(ns)
+    if len(games) > 0:
+        k = numpy.searchsorted(games, finishes) - 1
+        game = games[numpy.maximum(k, 0)]
+        unfinished = (k >= 0) & (game >= offsets[splayer]) & (code[game] == _SESSION_SG)
+        game_time = fd - d[game]
+    gs = times[_SESSION_FG]
+    pls = times[_SESSION_FP]
+    es = times[_SESSION_FE]
+
+    saves = numpy.bincount(rsession[(code == _SESSION_S) & insession], minlength=ns).tolist()
+    continued = units[~start[units]]
+    manual = numpy.bincount(gsession[continued], weights=[getattr(gacts[k], 'ma', 0) for k in continued.tolist()],
+                            minlength=ns).astype(numpy.int64)
+    manual += [getattr(gacts[k], 'ma', 0) for k in gstart.tolist()]
+    platforms = {}
+    for k in numpy.flatnonzero((code >= _SESSION_PL_A) & (code <= _SESSION_PL_L) & insession).tolist():
+        platforms.setdefault(int(rsession[k]), set()).add(_SESSION_PLATFORMS[int(code[k])])
+    traditions = [None] * ns
+    for k in numpy.flatnonzero((gcode == _SESSION_F) | (gcode == _SESSION_T)).tolist():
+        s = int(gsession[k])
+        if traditions[s] is None:
+            traditions[s] = getattr(gacts[k], 'p', None)
+
+    # the per-try stats of every session in the order of creation
+    ws = [{} for _ in range(ns)]
+    for s, w, t, u, p, dmg, bee, wons in zip(grp_session.tolist(), grp_wave.tolist(), grp_try.tolist(),
+                                             grp_units.tolist(), grp_punits.tolist(), grp_dmg.tolist(),
+                                             grp_bee.tolist(), grp_wons.tolist()):
+        ws[s].setdefault(w, {})[t] = (u, p, dmg, bee, 0, wons)
+
+    names = session_lists(gsession[units], unit_names, ns)
+    dates = d.tolist()
+    waves = wave.tolist()
+    programs = units[programmed]
+    art = session_lists(gsession[programs],
+                        [(cs[0], (name, cs[2], cs[3], dates[k], a.v))
+                         for cs, name, a, k in zip(unit_cs, unit_names, unit_acts, g[units].tolist()) if cs is not None], ns)
+    program_waves = session_lists(gsession[programs], wave[programs].tolist(), ns)
+    player_sessions = [values[2] for values in players.values()]
+    for k, (s, f, gs_s, gf, p) in enumerate(zip(starts.tolist(), finishes.tolist(), gstart.tolist(),
+                                                gfinish.tolist(), splayer.tolist())):
+        v = set(versions[s:f])
+        if not last[k]:
+            v.add(versions[f])
+        session = Session(v=v, l=gacts[gs_s].l, w=waves[gf - 1], ws=ws[k],
+                          sd=float(sd[k]), fd=float(fd[k]), smid=int(mid[srow[k]]), fmid=int(fmid[k]),
+                          sidx=int(c[srow[k]]), fidx=int(fidx[k]),
+                          a=gacts[gs_s:gf], u=list(dict.fromkeys(names[k])), t=traditions[k], art=dict(art[k]),
+                          gs=gs[k], pls=pls[k], es=es[k], sa=saves[k], ma=int(manual[k]))
+        if k in platforms:
+            session.plat = platforms[k]
+        if len(program_waves[k]) > 0:
+            session.wp = program_waves[k][0]
+        if unfinished[k]:
+            session.gs.append(float(game_time[k]))
+        player_sessions[p].append(session)
+
+def reconstruct_sessions(players):
+    if numpy is not None and VECTORIZED_SESSIONS:
+        reconstruct_players_sessions(players)
+    else:
+        for _, datetable, sessions in players.values():
+            reconstruct_player_sessions(datetable, sessions)
+
+# the players of reconstruct_sessions_parallel() shared with the forked workers
+_sessions_players = None
+
+def reconstruct_sessions_chunk(chunk):
+    # the worker part of reconstruct_sessions_parallel(): the session
+    # activities are returned as the positions in the player's datetable
+    if _sessions_players is not None:
+        chunk = [(player, _sessions_players[player][1]) for player in chunk]
+    players = {player: ({}, datetable, []) for player, datetable in chunk}
+    reconstruct_sessions(players)
+    result = []
+    for player, datetable in chunk:
+        positions = {id(x[3]): k for k, x in enumerate(datetable)}
+        sessions = players[player][2]
+        for s in sessions:
+            s.a = [positions[id(a)] for a in s.a]
+        result.append(sessions)
+    return result
+
+def reconstruct_sessions_parallel(players, workers):
+    # the players are split into the chunks of about the same number of
+    # activities, the sessions are collected in the players order, so the
+    # result does not depend on the number of workers
+    total = sum(len(datetable) for _, datetable, _ in players.values())
+    chunk_size = total // (workers * PARALLEL_SESSIONS_CHUNKS) + 1
+    chunks = [[]]
+    size = 0
+    for player, values in players.items():
+        if size >= chunk_size:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(player)
+        size += len(values[1])
+    print('reconstruct sessions of {} chunks with {} workers'.format(len(chunks), workers))
+    global _sessions_players
+    # the forked workers inherit the activities, otherwise they are sent
+    # with the chunks
+    fork = multiprocessing.get_start_method() == 'fork'
+    if fork:
+        _sessions_players = players
+    gc.disable()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=gc.disable) as executor:
+            futures = [executor.submit(reconstruct_sessions_chunk,
+                                       chunk if fork else [(player, players[player][1]) for player in chunk])
+                       for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                for player, sessions in zip(chunk, future.result()):
+                    _, datetable, player_sessions = players[player]
+                    for s in sessions:
+                        s.a = [datetable[k][3] for k in s.a]
+                    player_sessions.extend(sessions)
+    finally:
+        _sessions_players = None
+        gc.enable()
+
+def reconstruct_sessions_workers(players, workers):
+    if workers > 1 and sum(len(values[1]) for values in players.values()) >= PARALLEL_MIN_ACTIVITIES:
+        reconstruct_sessions_parallel(players, workers)
+    else:
+        reconstruct_sessions(players)
 
-            if 'ma' in a:
-                manual = a['ma']
-            else:
-                manual = 0
-
-            if act_type == 'p' and cur_session is not None:
-                tries = cur_session['ws'][cur_session['w']]
-                max_try = max(tries.keys())
-                if 'enm_be' in a:
-                    tries[max_try][3] += a['enm_be']
-                if 'enm_oth' in a:
-                    tries[max_try][3] += a['enm_oth']
-
-            if act_type in ('f', 'u', 't'):
-                level = a['l']
-                if 'w' not in a: 
-                    continue
-                wave = a['w']
-                version = a['v']
-            
-                unit = a['u'] if a['t'] == 'u' else None
-                art_cs = a['ac'] if 'ac' in a else None
+def read_appended_activities(csv_file, offset, delimiter):
+    # the activity ids of the rows after the offset by the player
+    players = {}
+    with open_data_file(csv_file, offset) as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) != _CSV_SIZE or row[_CSV_ID] == 'id':
+                continue
+            if row[_CSV_PLAYER] not in players:
+                players[row[_CSV_PLAYER]] = set([])
+            players[row[_CSV_PLAYER]].add(row[_CSV_ID])
+    return players
 
-                if cur_session is not None and wave not in cur_session['ws']:
-                    cur_try = 1
-                    cur_session['ws'][wave] = {cur_try: [0, 0, 0.0, 0, 0, 0]}
-                
-                if cur_session is not None and level == cur_session['l'] and wave >= cur_session['w']:
-                    if unit is not None:
-                        if unit not in cur_session['u']:
-                            cur_session['u'].append(unit)
-                        if art_cs is not None:
-                            cur_session['art'][art_cs[0]] = (unit, art_cs[2], art_cs[3], d, version)
-                            #else:
-                            #    print('program {} is already in session, orig: {}'.format(art_cs[0], cur_session['art'][art_cs[1]]))
-                            cur_session['ws'][wave][cur_try][1] += 1
-                            if 'wp' not in cur_session:
-                                cur_session['wp'] = wave
-                        cur_session['ws'][wave][cur_try][0] += 1
-                        if 'drone_damage' in a['m']: 
-                            cur_session['ws'][wave][cur_try][2] += a['m']['drone_damage']
-                        cur_session['ma'] += manual
-                    if tradition is not None and cur_session['t'] is None:
-                        cur_session['t'] = tradition
-                    if act_type == 'f' and a['y'] > cur_try:
-                        cur_try += 1
-                        cur_session['ws'][wave][cur_try] = [0, 0, 0.0, 0, 0, int(a['base'] == 10)]
-                    cur_session['w'] = wave
-                    cur_session['a'].append(a)
-                    if d > cur_session['fd']:
-                        cur_session['fd'] = d
-                    cur_session['sa'] += save
-                else:
-                    if cur_session is not None:
-                        cur_session['gs'] = cur_games
-                        if cur_start_game is not None:
-                            cur_session['gs'].append(cur_session['fd'] - cur_start_game)
-                        cur_session['pls'] = cur_placements
-                        cur_session['es'] = cur_editings
-                        cur_games = []
-                        cur_placements = []
-                        cur_editings = []
-                        avg_sum_session(cur_session)
-                        sessions.append(cur_session)
-
-                    if len(sessions) > 0:
-                        pre_sd = d
-                        pre_smid = metrics_id
-                        pre_sidx = cindex
-                    cur_try = 1
-                    if 'base' not in a:
-                        base = 0
-                    else:
-                        base = int(a['base'] == 10)
-                    cur_session = {'v': set([a['v']]), 'l': level, 'w': wave, 'ws': {wave: {cur_try: [0, 0, 0.0, 0, 0, base]}},
-                                   'sd': d if pre_sd is None else pre_sd, 'fd': d,
-                                   'smid': metrics_id if pre_smid is None else pre_smid, 'fmid': metrics_id,
-                                   'sidx': cindex if pre_sidx is None else pre_sidx, 'fidx': cindex,
-                                   'a': [a], 'u': [], 't': tradition, 'art': {}, 'gs': [], 'pls': [], 'es': [], 'sa': save,
-                                   'ma': manual, 'avg_bee': 0, 'avg_bugs': 0, 'avg_wons': 0}
-                    if unit is not None:
-                        cur_session['u'].append(unit)
-                        cur_session['ws'][wave][cur_try][0] += 1
-                        if art_cs is not None:
-                            cur_session['art'][art_cs[0]] = (unit, art_cs[2], art_cs[3], d, version)
-                            cur_session['ws'][wave][cur_try][1] += 1
-                            cur_session['wp'] = wave
-                        if 'drone_damage' in a['m']:
-                            cur_session['ws'][wave][cur_try][2] += a['m']['drone_damage']
+def stored_session(session, ids):
+    s = Session()
+    for k in Session.__slots__:
+        if hasattr(session, k):
+            setattr(s, k, getattr(session, k))
+    s.a = [ids[id(a)] for a in session.a]
+    return s
+
+def restore_sessions(stored, activities):
+    for s in stored:
+        s.a = [activities[aid] for aid in s.a]
+    return stored
+
+def session_resume_point(activities, sessions):
+    # the activities sorted at or after the start of the last session are
+    # reprocessed when the player gets new activities, the ones before it
+    # stay in the closed sessions
+    if len(sessions) < 2:
+        return None
+    start = sessions[-1].a[0]
+    key = (start.c, start.i, start.d)
+    start_aid = None
+    tail = []
+    for aid, a in activities.items():
+        if a is start:
+            start_aid = aid
+        k = (a.c, a.i, a.d)
+        if k > key or (k == key and start_aid is not None):
+            tail.append(aid)
+    return start_aid, len(activities) - len(tail), tail
+
+def resume_player_sessions(values, stored, resume, changed):
+    # reopens the last session of the player, returns False when the changed
+    # activities may affect the closed sessions
+    activities, datetable, sessions = values
+    if resume is None:
+        return False
+    start_aid, closed, tail = resume
+    if start_aid in changed or any(aid not in activities for aid in tail):
+        return False
+    tail = set(tail)
+    added = [aid for aid in changed if aid in activities and aid not in tail]
+    if len(added) != len(activities) - closed - len(tail):
+        return False
+    ordered = sorted(datetable, key = lambda x: (x[1], x[2], x[0]))
+    if ordered[closed][3] is not activities[start_aid]:
+        return False
+    start_game = None
+    for x in reversed(ordered[:closed]):
+        if x[3].t == 'sg':
+            start_game = x[0]
+            break
+        if x[3].t == 'fg':
+            break
+    sessions.extend(restore_sessions(stored[:-1], activities))
+    reconstruct_player_sessions(ordered[closed:], sessions, start_game)
+    return True
+
+def update_players_sessions(players, csv_file, player_filter, delimiter, workers, offset, last_id):
+    # the session store keeps the sessions of every player with the byte offset
+    # of the data, only the players with the rows appended after the offset are
+    # processed again: their last session is reopened and extended, or all
+    # their sessions are rebuilt when the new rows change the closed ones
+    cache = cache_file('session-store', csv_file, player_filter, None, delimiter)
+    store = load_cache(cache, code_fingerprint())
+    if store is not None and not data_file_appended(csv_file, store, delimiter):
+        store = None
+    if store is None:
+        rebuild = players
+    else:
+        appended = read_appended_activities(csv_file, store['offset'], delimiter)
+        rebuild = {}
+        restored = resumed = 0
+        for player, values in players.items():
+            if player not in store['players']:
+                rebuild[player] = values
+                continue
+            stored, resume = store['players'][player]
+            changed = appended.get(unpack_player(player))
+            if changed is None:
+                values[2].extend(restore_sessions(stored, values[0]))
+                restored += 1
+            elif resume_player_sessions(values, stored, resume, changed):
+                resumed += 1
             else:
-                if cur_session is not None:
-                    cur_session['sa'] += save
-                    save = 0
-                    if d > cur_session['fd']:
-                        cur_session['fd'] = d
-                    if metrics_id > cur_session['fmid']:
-                        cur_session['fmid'] = metrics_id
-                    if cindex > cur_session['fidx']:
-                        cur_session['fidx'] = cindex
-
-        if cur_session is not None:
-            cur_session['sa'] += save
-            save = 0
-            if d > cur_session['fd']:
-                cur_session['fd'] = d
-            if metrics_id > cur_session['fmid']:
-                cur_session['fmid'] = metrics_id
-            if cindex > cur_session['fidx']:
-                cur_session['fidx'] = cindex
-            cur_session['gs'] = cur_games
-            if cur_start_game is not None:
-                cur_session['gs'].append(cur_session['fd'] - cur_start_game)
-            cur_session['pls'] = cur_placements
-            cur_session['es'] = cur_editings
-            cur_games = []
-            cur_placements = []
-            cur_editings = []
-            avg_sum_session(cur_session)
-            sessions.append(cur_session)
+                rebuild[player] = values
+        print('sessions of {} players restored, {} resumed, {} rebuilt'.format(restored, resumed, len(rebuild)))
+    reconstruct_sessions_workers(rebuild, workers)
+    if store is None or offset - store['offset'] > INGEST_SNAPSHOT_RATIO * store['offset']:
+        store = {'offset': offset, 'last_id': last_id, 'players': {}}
+        for player, values in players.items():
+            activities, _, sessions = values
+            ids = {id(a): aid for aid, a in activities.items()}
+            store['players'][player] = ([stored_session(s, ids) for s in sessions],
+                                        session_resume_point(activities, sessions))
+        save_ingest_state(cache, store)
+
+def session_summary(s):
+    avg_unit_wave = 0
+    tries = 0
+    for wave, ws in s['ws'].items():
+        for tri in ws.values():
+            avg_unit_wave += tri[0]
+            tries += 1
+    avg_unit_wave /= tries
+    return {'versions': ', '.join(sorted(s['v'])),
+            'l': s['l'], 'w': s['w'], 'tries': s['tries'],
+            'sd': s['sd'], 'fd': s['fd'],
+            'smid': s['smid'], 'fmid': s['fmid'],
+            'sidx': s['sidx'], 'fidx': s['fidx'],
+            'activities': len(s['a']),
+            't': s['t'],
+            'unit_types': ', '.join(s['u']),
+            'units': s['units'], 'units_wave': avg_unit_wave, 'punits': s['punits'],
+            'programs': len(s['art']),
+            'ma': s['ma'], 'sa': s['sa'],
+            'avg_u': s['avg_u'], 'avg_p': s['avg_p'], 'avg_d': s['avg_d'],
+            'avg_gs': s['avg_gs'], 'avg_pls': s['avg_pls'], 'avg_es': s['avg_es'],
+            'places': s['places'], 'edits': s['edits'],
+            'avg_bee': s['avg_bee'], 'avg_bugs': s['avg_bugs'], 'avg_wons': s['avg_wons']}
+
+def print_session(s):
+    print("versions: ({}), level: {}, last wave: {}, waves(tries): {}, date from: {}, to: {}, metrics from: {}, to: {}, cindex from: {}, to: {}, activities: {}, tradition: {}, unit types: ({}), units: {}, units per wave: {:5.2f}, pr.units: {}, uniq progs: {}, manual use: {}, saves: {}, avg units: {:5.2f}, avg prog percent: {:5.2f}%, avg dmg: {:6.1f}, avg g.s.: {:5.2f}, avg pl.s.: {:5.2f}, avg ed.s.: {:5.2f}, pls: {:6.2f}, eds: {:6.2f}, avg.bee: {:5.2f}, avg.bugs: {:5.2f}, avg.wons: {:5.2f}".format(
+        s['versions'],
+        s['l'], s['w'], s['tries'],
+        datetime.datetime.fromtimestamp(s['sd']).strftime('%Y-%m-%d %H:%M:%S'),
+        datetime.datetime.fromtimestamp(s['fd']).strftime('%Y-%m-%d %H:%M:%S'),
+        s['smid'], s['fmid'],
+        s['sidx'], s['fidx'],
+        s['activities'],
+        s['t'],
+        s['unit_types'],
+        s['units'], s['units_wave'], s['punits'],
+        s['programs'],
+        s['ma'], s['sa'],
+        s['avg_u'], s['avg_p'] * 100.0, s['avg_d'],
+        s['avg_gs'], s['avg_pls'], s['avg_es'],
+        s['places'], s['edits'], s['avg_bee'], s['avg_bugs'], s['avg_wons']))
+
+def read_players_sessions(csv_file, player_filter=None, print_sessions=False, delimiter=CSV_DELIMITER, columnar=False, workers=None):
+    cache = cache_file('sessions', csv_file, player_filter, None, delimiter, columnar)
+    players = load_cache(cache)
+    if players is None:
+        if workers is None:
+            workers = WORKERS
+        if columnar:
+            players = read_players_columns(csv_file, player_filter, None, delimiter)
+            print('reconstruct sessions...')
+            for player, values in players.items():
+                activities, datetable, sessions = values
+                reconstruct_player_sessions(datetable, sessions)
+        elif os.path.isdir(csv_file):
+            players = read_players_data(csv_file, player_filter, None, delimiter, workers)
+            print('reconstruct sessions...')
+            reconstruct_sessions_workers(players, workers)
+        else:
+            players, offset, last_id = ingest_players_data(csv_file, player_filter, None, delimiter, workers)
+            print('reconstruct sessions...')
+            update_players_sessions(players, csv_file, player_filter, delimiter, workers, offset, last_id)
+        save_cache(cache, players)
 
     if print_sessions:
         for player, values in players.items():
             print(player, ':')
             _, _, sessions = values
             for s in sessions:
-                avg_unit_wave = 0
-                tries = 0
-                for wave, ws in s['ws'].items():
-                    for tri in ws.values():
-                        avg_unit_wave += tri[0]
-                        tries += 1
-                avg_unit_wave /= tries
-                print("versions: ({}), level: {}, last wave: {}, waves(tries): {}, date from: {}, to: {}, metrics from: {}, to: {}, cindex from: {}, to: {}, activities: {}, tradition: {}, unit types: ({}), units: {}, units per wave: {:5.2f}, pr.units: {}, uniq progs: {}, manual use: {}, saves: {}, avg units: {:5.2f}, avg prog percent: {:5.2f}%, avg dmg: {:6.1f}, avg g.s.: {:5.2f}, avg pl.s.: {:5.2f}, avg ed.s.: {:5.2f}, pls: {:6.2f}, eds: {:6.2f}, avg.bee: {:5.2f}, avg.bugs: {:5.2f}, avg.wons: {:5.2f}".format(
-                    ', '.join(sorted(s['v'])),
-                    s['l'], s['w'], s['tries'],
-                    datetime.datetime.fromtimestamp(s['sd']).strftime('%Y-%m-%d %H:%M:%S'),
-                    datetime.datetime.fromtimestamp(s['fd']).strftime('%Y-%m-%d %H:%M:%S'),
-                    s['smid'], s['fmid'],
-                    s['sidx'], s['fidx'],
-                    len(s['a']),
-                    s['t'],
-                    ', '.join(s['u']),
-                    s['units'], avg_unit_wave, s['punits'],
-                    len(s['art']),
-                    s['ma'], s['sa'],
-                    s['avg_u'], s['avg_p'] * 100.0, s['avg_d'],
-                    s['avg_gs'], s['avg_pls'], s['avg_es'],
-                    s['places'], s['edits'], s['avg_bee'], s['avg_bugs'], s['avg_wons']))
+                print_session(session_summary(s))
 
     return players
 
-def read_time_statistics(csv_file, player_filter=None):
+def read_time_statistics(csv_file, player_filter=None, columnar=False):
+    if columnar:
+        players = read_players_columns(csv_file, player_filter)
+        days = players.columns['ddate']
+        actions = numpy.bincount(days, minlength=len(players.days))
+        day_players = numpy.unique(days.astype(numpy.int64) * len(players) + players.player_column())
+        day_players = numpy.bincount(day_players // len(players), minlength=len(players.days))
+        players_stats = {}
+        actions_stats = {}
+        for n, d in enumerate(players.days):
+            if actions[n] > 0:
+                players_stats[d] = int(day_players[n])
+                actions_stats[d] = int(actions[n])
+        return players_stats, actions_stats
+
     players = read_players_data(csv_file, player_filter)
 
     players_stats = {}
@@ -618,6 +2656,135 @@ def read_time_statistics(csv_file, player_filter=None):
 
     return players_stats, actions_stats
 
+_DATABASE_SCHEMA = '''
+CREATE TABLE source (fingerprint TEXT);
+CREATE TABLE activities (player TEXT, id TEXT, d REAL, ddate TEXT, version TEXT, type TEXT,
+                         level TEXT, wave INTEGER, unit TEXT, tradition TEXT, cindex INTEGER, metrics_id INTEGER);
+CREATE TABLE sessions (id INTEGER PRIMARY KEY, player TEXT, n INTEGER, sdate TEXT,
+                       versions TEXT, l TEXT, w INTEGER, tries INTEGER, sd REAL, fd REAL,
+                       smid INTEGER, fmid INTEGER, sidx INTEGER, fidx INTEGER, activities INTEGER,
+                       t TEXT, unit_types TEXT, units INTEGER, units_wave REAL, punits INTEGER,
+                       programs INTEGER, ma INTEGER, sa INTEGER, avg_u REAL, avg_p REAL, avg_d REAL,
+                       avg_gs REAL, avg_pls REAL, avg_es REAL, places REAL, edits REAL,
+                       avg_bee REAL, avg_bugs REAL, avg_wons REAL);
+CREATE TABLE session_versions (session INTEGER, version TEXT);
+CREATE TABLE session_platforms (session INTEGER, platform TEXT);
+CREATE TABLE session_programs (session INTEGER, artefact TEXT, unit TEXT, damage REAL, enemies INTEGER, version TEXT);
+CREATE TABLE programs (artefact TEXT PRIMARY KEY, phash TEXT, phash_with_name TEXT);
+CREATE INDEX activities_player ON activities (player);
+CREATE INDEX activities_ddate ON activities (ddate);
+CREATE INDEX sessions_player ON sessions (player);
+CREATE INDEX sessions_sdate ON sessions (sdate);
+CREATE INDEX sessions_level ON sessions (l);
+CREATE INDEX session_versions_version ON session_versions (version, session);
+CREATE INDEX session_platforms_platform ON session_platforms (platform, session);
+CREATE INDEX session_programs_artefact ON session_programs (artefact);
+CREATE INDEX programs_phash ON programs (phash);
+CREATE INDEX programs_phash_with_name ON programs (phash_with_name);
+'''
+
+def write_sessions_database(db, players):
+    for player, values in players.items():
+        activities, _, sessions = values
+        db.executemany('INSERT INTO activities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       ((player, aid, a.d, a.ddate, a.v, a.t, a.get('l'), a.get('w'), a.get('u'), a.get('p'), a.c, a.i)
+                        for aid, a in activities.items()))
+        for n, s in enumerate(sessions):
+            summary = session_summary(s)
+            columns = ['player', 'n', 'sdate'] + list(summary.keys())
+            cursor = db.execute('INSERT INTO sessions ({}) VALUES ({})'.format(', '.join(columns), ', '.join('?' * len(columns))),
+                                [player, n, datetime.datetime.fromtimestamp(s.sd).strftime('%Y-%m-%d')] + list(summary.values()))
+            sid = cursor.lastrowid
+            db.executemany('INSERT INTO session_versions VALUES (?, ?)', ((sid, v) for v in s.v))
+            db.executemany('INSERT INTO session_platforms VALUES (?, ?)', ((sid, p) for p in s.get('plat', ())))
+            db.executemany('INSERT INTO session_programs VALUES (?, ?, ?, ?, ?, ?)',
+                           ((sid, artefact, unit, dmg, enemies, version)
+                            for artefact, (unit, dmg, enemies, _, version) in s.art.items()))
+
+def write_programs_database(db, players):
+    # the fingerprints of the players' programs found in the archive
+    programs = {}
+    names = {}
+    load_players_programs(players.keys(), programs, {}, {}, names=names)
+    db.executemany('INSERT INTO programs VALUES (?, ?, ?)',
+                   ((artefact, phash, names[artefact]) for artefact, phash in programs.items()))
+
+def sessions_database(csv_file, delimiter=CSV_DELIMITER):
+    # the SQLite copy of the players' activities and sessions for the repeated
+    # queries, it is rebuilt when the data file or the code changes
+    path = os.path.splitext(cache_file('sqlite', csv_file, None, None, delimiter)[0])[0] + '.sqlite'
+    fingerprint = repr(cache_fingerprint(csv_file))
+    if USE_CACHE and os.path.isfile(path):
+        db = sqlite3.connect(path)
+        try:
+            row = db.execute('SELECT fingerprint FROM source').fetchone()
+        except sqlite3.Error:
+            row = None
+        if row is not None and row[0] == fingerprint:
+            print('read from database {}'.format(path))
+            db.row_factory = sqlite3.Row
+            return db
+        db.close()
+    players = read_players_sessions(csv_file, None, False, delimiter)
+    print('write database {}...'.format(path))
+    if not os.path.isdir(CACHE_DIR):
+        os.mkdir(CACHE_DIR)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    db.executescript(_DATABASE_SCHEMA)
+    write_sessions_database(db, players)
+    write_programs_database(db, players)
+    db.execute('INSERT INTO source VALUES (?)', (fingerprint,))
+    db.commit()
+    db.close()
+    os.replace(tmp_path, path)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    return db
+
+def query_sessions(db, player=None, level=None, version=None, platform=None, date_from=None, date_to=None, phash=None):
+    # the sessions rows (see session_summary()) in the players order, the
+    # version is a prefix as in NEW_VERSIONS, the dates are YYYY-MM-DD,
+    # phash selects the sessions with the program of the fingerprint
+    conditions = []
+    args = []
+    if player is not None:
+        conditions.append('player = ?')
+        args.append(player)
+    if level is not None:
+        conditions.append('l = ?')
+        args.append(level)
+    if version is not None:
+        conditions.append('id IN (SELECT session FROM session_versions WHERE version GLOB ?)')
+        args.append(version + '*')
+    if platform is not None:
+        conditions.append('id IN (SELECT session FROM session_platforms WHERE platform = ?)')
+        args.append(platform)
+    if phash is not None:
+        conditions.append('id IN (SELECT session FROM session_programs JOIN programs USING (artefact) WHERE phash = ?)')
+        args.append(phash)
+    if date_from is not None:
+        conditions.append('sdate >= ?')
+        args.append(date_from)
+    if date_to is not None:
+        conditions.append('sdate <= ?')
+        args.append(date_to)
+    query = 'SELECT * FROM sessions'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return db.execute(query + ' ORDER BY id', args).fetchall()
+
+def query_time_statistics(db):
+    # the same values as read_time_statistics() returns
+    players_stats = {}
+    actions_stats = {}
+    for d, players, actions in db.execute('SELECT ddate, COUNT(DISTINCT player), COUNT(*) FROM activities GROUP BY ddate'):
+        players_stats[d] = players
+        actions_stats[d] = actions
+    return players_stats, actions_stats
+
 def load_default_programs(version = False):
     print('Loading default programs {}...'.format(NEW_VERSION if version else ''))
     programs = {}
@@ -648,54 +2815,417 @@ def load_program_path(graph_dir, unit):
     p.set_name('SM')
     return p
 
-def load_program(artefact_id):
+# the packed programs archive: the SQLite file with the zlib-compressed
+# program files stored once per content md5 and the artefacts referring to
+# them; the archived programs have the pseudo paths inside PROGRAMS_ARCHIVE
+_ARCHIVE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contents (md5 TEXT PRIMARY KEY, data BLOB);
+CREATE TABLE IF NOT EXISTS artefacts (artefact TEXT PRIMARY KEY, player TEXT, md5 TEXT);
+CREATE INDEX IF NOT EXISTS artefacts_player ON artefacts (player);
+'''
+
+_programs_archive = None
+
+def use_programs_archive():
+    return os.path.isfile(PROGRAMS_ARCHIVE)
+
+def programs_archive():
+    # the connection is not shared with the forked worker processes
+    global _programs_archive
+    if _programs_archive is None or _programs_archive[0] != os.getpid():
+        db = sqlite3.connect(PROGRAMS_ARCHIVE)
+        db.executescript(_ARCHIVE_SCHEMA)
+        _programs_archive = (os.getpid(), db)
+    return _programs_archive[1]
+
+def archived_program_path(player_id, artefact_id):
+    return os.path.join(PROGRAMS_ARCHIVE, player_id, artefact_id) + '.graphml'
+
+def is_archived_program(filepath):
+    return filepath.startswith(PROGRAMS_ARCHIVE + os.sep)
+
+def archived_artefact(filepath):
+    return os.path.basename(filepath)[:-len('.graphml')]
+
+def archive_program(player_id, artefact_id, content):
+    db = programs_archive()
+    h = hashlib.md5(content).hexdigest()
+    db.execute('INSERT OR IGNORE INTO contents VALUES (?, ?)', (h, zlib.compress(content)))
+    db.execute('INSERT OR REPLACE INTO artefacts VALUES (?, ?, ?)', (artefact_id, player_id, h))
+    db.commit()
+
+def archive_artefact_link(player_id, artefact_id, old_artefact_id):
+    # the artefact with the same content as the already archived one
+    db = programs_archive()
+    row = db.execute('SELECT md5 FROM artefacts WHERE artefact = ?', (old_artefact_id,)).fetchone()
+    if row is None:
+        return False
+    db.execute('INSERT OR REPLACE INTO artefacts VALUES (?, ?, ?)', (artefact_id, player_id, row[0]))
+    db.commit()
+    return True
+
+def archived_player(artefact_id):
+    row = programs_archive().execute('SELECT player FROM artefacts WHERE artefact = ?', (artefact_id,)).fetchone()
+    return row[0] if row is not None else None
+
+def archived_program_md5(filepath):
+    row = programs_archive().execute('SELECT md5 FROM artefacts WHERE artefact = ?',
+                                     (archived_artefact(filepath),)).fetchone()
+    return row[0] if row is not None else None
+
+def read_archived_program(filepath):
+    row = programs_archive().execute('SELECT contents.data FROM artefacts JOIN contents ON artefacts.md5 = contents.md5 '
+                                     'WHERE artefacts.artefact = ?', (archived_artefact(filepath),)).fetchone()
+    return zlib.decompress(row[0]) if row is not None else None
+
+def archived_player_programs(player_id):
+    rows = programs_archive().execute('SELECT artefact FROM artefacts WHERE player = ? ORDER BY rowid', (player_id,))
+    return [(artefact_id, archived_program_path(player_id, artefact_id)) for artefact_id, in rows]
+
+def open_program_document(filepath):
+    # CyberiadaML reads the files only, so the archived program is extracted
+    # into a temporary file
+    d = CyberiadaML.LocalDocument()
+    content = read_archived_program(filepath) if is_archived_program(filepath) else None
+    if content is None:
+        d.open(filepath, CyberiadaML.formatDetect, CyberiadaML.geometryFormatNone, False, False, True)
+        return d
+    fd, tmp_path = tempfile.mkstemp(suffix='.graphml')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        d.open(tmp_path, CyberiadaML.formatDetect, CyberiadaML.geometryFormatNone, False, False, True)
+    finally:
+        os.remove(tmp_path)
+    return d
+
+def pack_programs_archive():
+    # converts the directory archive: every file is stored once, the symlinks
+    # and the copies of the same content become the references
+    if not os.path.isdir(PROGRAMS_DIR):
+        print('No programs directory {}'.format(PROGRAMS_DIR))
+        exit(1)
+    files = 0
+    db = programs_archive()
+    for player_id in sorted(os.listdir(PROGRAMS_DIR)):
+        dir_path = os.path.join(PROGRAMS_DIR, player_id)
+        if not os.path.isdir(dir_path):
+            continue
+        for f in sorted(os.listdir(dir_path)):
+            filepath = os.path.join(dir_path, f)
+            if not f.endswith('.graphml') or not os.path.isfile(filepath):
+                continue
+            with open(filepath, 'rb') as pf:
+                content = pf.read()
+            h = hashlib.md5(content).hexdigest()
+            db.execute('INSERT OR IGNORE INTO contents VALUES (?, ?)', (h, zlib.compress(content)))
+            db.execute('INSERT OR REPLACE INTO artefacts VALUES (?, ?, ?)', (f[:-len('.graphml')], player_id, h))
+            files += 1
+            if files % 10000 == 0:
+                db.commit()
+                print('packed {} files'.format(files))
+    db.commit()
+    contents, = db.execute('SELECT COUNT(*) FROM contents').fetchone()
+    print('{} files packed into {} with {} unique contents'.format(files, PROGRAMS_ARCHIVE, contents))
+
+# the artefact index: the lines "<artefact-id>\t<player-id>" appended by
+# update-archive.py for every artefact file in the archive
+_artefact_index = None
+
+def artefact_index_file():
+    return os.path.join(PROGRAMS_DIR, ARTEFACT_INDEX)
+
+def load_artefact_index():
+    global _artefact_index
+    if _artefact_index is None:
+        _artefact_index = {}
+        if os.path.isfile(artefact_index_file()):
+            with open(artefact_index_file()) as f:
+                for line in f:
+                    # the interrupted appends leave the truncated lines
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) != 2 or not fields[0] or not fields[1]:
+                        continue
+                    _artefact_index[fields[0]] = fields[1]
+    return _artefact_index
+
+def add_artefact(player_id, artefact_id):
+    index = load_artefact_index()
+    if index.get(artefact_id) == player_id:
+        return
+    index[artefact_id] = player_id
+    with open(artefact_index_file(), 'a') as f:
+        f.write('{}\t{}\n'.format(artefact_id, player_id))
+
+def rebuild_artefact_index():
+    # scans the player directories of the archive
+    global _artefact_index
+    if not os.path.isdir(PROGRAMS_DIR):
+        print('No programs directory {}'.format(PROGRAMS_DIR))
+        exit(1)
+    _artefact_index = {}
+    lines = []
+    for player_id in sorted(os.listdir(PROGRAMS_DIR)):
+        dir_path = os.path.join(PROGRAMS_DIR, player_id)
+        if not os.path.isdir(dir_path):
+            continue
+        for f in sorted(os.listdir(dir_path)):
+            if f.endswith('.graphml'):
+                artefact_id = f[:-len('.graphml')]
+                _artefact_index[artefact_id] = player_id
+                lines.append('{}\t{}\n'.format(artefact_id, player_id))
+    tmp_path = artefact_index_file() + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.writelines(lines)
+    os.replace(tmp_path, artefact_index_file())
+    print('{} artefacts indexed'.format(len(_artefact_index)))
+
+def find_artefact(artefact_id):
+    # the artefact file path in the packed archive or by the index, the
+    # artefacts missing in it are searched in all the player directories
+    if use_programs_archive():
+        player_id = archived_player(artefact_id)
+        if player_id is not None:
+            return archived_program_path(player_id, artefact_id)
+    player_id = load_artefact_index().get(artefact_id)
+    if player_id is not None:
+        filepath = get_artefact_file(player_id, artefact_id)
+        if os.path.isfile(filepath):
+            return filepath
+    if not os.path.isdir(PROGRAMS_DIR):
+        return None
     for u in os.listdir(PROGRAMS_DIR):
-        dir_path = os.path.join(PROGRAMS_DIR, u)
-        filepath = os.path.join(dir_path, artefact_id + '.graphml')
+        filepath = get_artefact_file(u, artefact_id)
         if os.path.isfile(filepath):
-            d = CyberiadaML.LocalDocument()
-            d.open(filepath, CyberiadaML.formatDetect, CyberiadaML.geometryFormatNone, False, False, True)
-            program = CyberiadaML.StateMachine(d.get_state_machines()[0])
-            return program
+            add_artefact(u, artefact_id)
+            return filepath
     return None
 
-def load_player_programs(player_id, programs, hashes, hashes_with_name):
-    file_hashes = {}
+def load_program(artefact_id):
+    filepath = find_artefact(artefact_id)
+    if filepath is None:
+        return None
+    d = open_program_document(filepath)
+    program = CyberiadaML.StateMachine(d.get_state_machines()[0])
+    return program
+
+PROGRAM_ERRORS = {'CybMLException': 'Bad program CyberiadaML file:',
+                  'XMLException': 'Bad program xml file:',
+                  'FileException': 'Bad program file:'}
+
+# the programs cache: {md5: (status, fingerprint with name, fingerprint)} with
+# the number of the cache hits and of the parsed files
+_programs_cache = None
+_programs_stats = [0, 0]
+
+def cyberiadaml_fingerprint():
+    # the fingerprints are the digests of the CyberiadaML program text, so
+    # the cache is dropped when the library or its extension is replaced
+    files = [getattr(CyberiadaML, '__file__', None),
+             getattr(getattr(CyberiadaML, '_CyberiadaML', None), '__file__', None)]
+    stats = []
+    for f in files:
+        if f is not None and os.path.isfile(f):
+            st = os.stat(f)
+            stats.append((f, st.st_size, st.st_mtime_ns))
+    return (getattr(CyberiadaML, '__version__', None),) + tuple(stats)
+
+def programs_cache_fingerprint():
+    return (CACHE_FORMAT, PROGRAMS_CACHE_FORMAT) + cyberiadaml_fingerprint()
+
+def programs_cache():
+    global _programs_cache
+    if _programs_cache is None:
+        cache = (os.path.join(CACHE_DIR, PROGRAMS_CACHE), None)
+        _programs_cache = load_cache(cache, programs_cache_fingerprint())
+        if _programs_cache is None:
+            _programs_cache = {}
+        atexit.register(save_programs_cache)
+    return _programs_cache
+
+def save_programs_cache():
+    hits, parsed = _programs_stats
+    print('programs cache: {} hits, {} files parsed'.format(hits, parsed))
+    if parsed > 0:
+        save_cache((os.path.join(CACHE_DIR, PROGRAMS_CACHE), None), _programs_cache,
+                   programs_cache_fingerprint())
+
+# the md5 of the program files: {path: (size, mtime, md5)} with the number
+# of the files read
+_program_files = None
+_program_files_stats = [0]
+
+def program_files_cache():
+    global _program_files
+    if _program_files is None:
+        cache = (os.path.join(CACHE_DIR, PROGRAM_FILES_CACHE), None)
+        _program_files = load_cache(cache, (CACHE_FORMAT,))
+        if _program_files is None:
+            _program_files = {}
+        atexit.register(save_program_files_cache)
+    return _program_files
+
+def save_program_files_cache():
+    if _program_files_stats[0] > 0:
+        save_cache((os.path.join(CACHE_DIR, PROGRAM_FILES_CACHE), None), _program_files, (CACHE_FORMAT,))
+
+def program_fingerprint(pstr):
+    # the stable digest of the program text, the same in all the processes
+    # and runs unlike hash()
+    return hashlib.blake2b(pstr.encode('utf-8'), digest_size=16).hexdigest()
+
+def parse_program_file(filepath):
+    # returns the program renamed to SM and its parse status with the fingerprints
+    try:
+        d = open_program_document(filepath)
+        p = CyberiadaML.StateMachine(d.get_state_machines()[0])
+        phash_with_name = program_fingerprint(str(p))
+        p.set_name('SM')
+        phash = program_fingerprint(str(p))
+    except CyberiadaML.CybMLException:
+        return None, ('CybMLException', None, None)
+    except CyberiadaML.XMLException:
+        return None, ('XMLException', None, None)
+    except CyberiadaML.FileException:
+        return None, ('FileException', None, None)
+    return p, ('ok', phash_with_name, phash)
+
+class UniqueProgram(list):
+    # the unique program [artefact, program, count], the program is parsed
+    # on the first access, so the programs the script does not look at are
+    # never opened
+    __slots__ = ('filepath',)
+
+    def __init__(self, artefact, filepath, p):
+        list.__init__(self, (artefact, p, 1))
+        self.filepath = filepath
+
+    def program(self):
+        p = list.__getitem__(self, 1)
+        if p is None:
+            p, _ = parse_program_file(self.filepath)
+            list.__setitem__(self, 1, p)
+        return p
+
+    def __getitem__(self, k):
+        if k == 1 or k == -2:
+            return self.program()
+        return list.__getitem__(self, k)
+
+    def __iter__(self):
+        self.program()
+        return list.__iter__(self)
+
+def player_program_files(player_id):
+    if use_programs_archive():
+        return archived_player_programs(unpack_player(player_id))
     dir_path = os.path.join(PROGRAMS_DIR, unpack_player(player_id))
     if not os.path.isdir(dir_path):
-        return 
-    for f in os.listdir(dir_path):
-        filepath = os.path.join(dir_path, f)
-        artefact = f.split('.')[0]
-        h = hashlib.md5(open(filepath,'rb').read()).hexdigest()
+        return []
+    return [(f.split('.')[0], os.path.join(dir_path, f)) for f in os.listdir(dir_path)]
+
+def add_player_programs(files, programs, hashes, hashes_with_name, parsed = None, names = None):
+    # the artefacts are immutable, so only the never seen files are parsed
+    # to get their fingerprints, the unique programs are parsed on the first
+    # access (see UniqueProgram); the files are (artefact, path, md5), the
+    # parse results of the files parsed by the workers are in parsed, names
+    # gets the fingerprints with the program names of the artefacts
+    file_hashes = {}
+    cache = programs_cache()
+    for artefact, filepath, h in files:
         if h in file_hashes:
             programs[artefact] = file_hashes[h]
+            if names is not None:
+                names[artefact] = cache[h][1]
             continue
-        try:
-            d = CyberiadaML.LocalDocument()
-            d.open(filepath, CyberiadaML.formatDetect, CyberiadaML.geometryFormatNone, False, False, True)
-            p = CyberiadaML.StateMachine(d.get_state_machines()[0])
-            phash_with_name = hash(str(p))    
-            p.set_name('SM')
-            phash = hash(str(p))
-            #print(hash(str(p)),str(p))
-        except CyberiadaML.CybMLException:
-            print('Bad program CyberiadaML file:', filepath)
-            continue
-        except CyberiadaML.XMLException:
-            print('Bad program xml file:', filepath)
-            continue
-        except CyberiadaML.FileException:
-            print('Bad program file:', filepath)
+        p = None
+        if h in cache:
+            _programs_stats[0] += 1
+        elif parsed is not None and h in parsed:
+            _programs_stats[1] += 1
+            cache[h] = parsed[h]
+        else:
+            _programs_stats[1] += 1
+            p, cache[h] = parse_program_file(filepath)
+        status, phash_with_name, phash = cache[h]
+        if status != 'ok':
+            print(PROGRAM_ERRORS[status], filepath)
             continue
         file_hashes[h] = phash
         programs[artefact] = phash
+        if names is not None:
+            names[artefact] = phash_with_name
         if phash_with_name not in hashes_with_name:
             hashes_with_name[phash_with_name] = True
         if phash in hashes:
             hashes[phash][2] += 1
             continue
-        hashes[phash] = [artefact, p, 1]
+        hashes[phash] = UniqueProgram(artefact, filepath, p)
+
+def file_md5(filepath, h = None):
+    # the md5 of the unchanged files is taken from the cache by their size
+    # and mtime, h is the md5 already computed by a worker process
+    if is_archived_program(filepath):
+        return archived_program_md5(filepath) if h is None else h
+    st = os.stat(filepath)
+    key = os.path.abspath(filepath)
+    files = program_files_cache()
+    entry = files.get(key)
+    if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+        return entry[2]
+    if h is None:
+        with open(filepath, 'rb') as f:
+            h = hashlib.md5(f.read()).hexdigest()
+    files[key] = (st.st_size, st.st_mtime_ns, h)
+    _program_files_stats[0] += 1
+    return h
+
+def load_player_programs(player_id, programs, hashes, hashes_with_name, names = None):
+    files = [(artefact, filepath, file_md5(filepath)) for artefact, filepath in player_program_files(player_id)]
+    add_player_programs(files, programs, hashes, hashes_with_name, names=names)
+
+def classify_program_files(paths):
+    # the worker part of load_players_programs(): the md5 of the files with
+    # the parse results of the files missing in the programs cache
+    cache = programs_cache()
+    seen = set([])
+    result = []
+    for filepath in paths:
+        h = file_md5(filepath)
+        if h in cache or h in seen:
+            result.append((h, None))
+        else:
+            seen.add(h)
+            result.append((h, parse_program_file(filepath)[1]))
+    return result
+
+def load_players_programs(player_ids, programs, hashes, hashes_with_name, workers = None, names = None):
+    # loads the programs of the players as load_player_programs() does one by
+    # one, the files are read and the new ones are parsed by the worker
+    # processes, the unique programs are opened on the first access
+    if workers is None:
+        workers = WORKERS
+    players_files = [player_program_files(player) for player in player_ids]
+    paths = [filepath for files in players_files for _, filepath in files]
+    if workers <= 1 or len(paths) < PARALLEL_MIN_PROGRAMS:
+        for files in players_files:
+            add_player_programs([(artefact, filepath, file_md5(filepath)) for artefact, filepath in files],
+                                programs, hashes, hashes_with_name, names=names)
+        return
+    programs_cache()
+    program_files_cache()
+    chunk_size = len(paths) // (workers * PARALLEL_PROGRAMS_CHUNKS) + 1
+    chunks = [paths[k:k + chunk_size] for k in range(0, len(paths), chunk_size)]
+    print('load {} program files in {} chunks with {} workers'.format(len(paths), len(chunks), workers))
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        results = list(itertools.chain.from_iterable(executor.map(classify_program_files, chunks)))
+    parsed = {h: entry for h, entry in results if entry is not None}
+    k = 0
+    for files in players_files:
+        add_player_programs([(artefact, filepath, file_md5(filepath, results[k + n][0]))
+                             for n, (artefact, filepath) in enumerate(files)],
+                            programs, hashes, hashes_with_name, parsed, names)
+        k += len(files)
 
 def load_players_list(filename):
     players = {}
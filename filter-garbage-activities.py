@@ -32,7 +32,7 @@ def usage():
     exit(1)
 
 def filter_players(players_file, stats):
-    reader = csv.reader(open(players_file), delimiter=',')
+    reader = csv.reader(data.open_data_file(players_file), delimiter=',')
     i = 0
     for row in reader:
         i += 1
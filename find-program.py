@@ -31,13 +31,15 @@ import datetime
 DEFAULT_PLAYERS_DATA = 'test.csv'
 
 def usage(msg = ''):
-    print("Usage: {} [database-path] <artefact-id>".format(sys.argv[0]))
+    print("Usage: {} [--no-cache] [--mmap] [--workers N] [database-path] <artefact-id>".format(sys.argv[0]))
     if msg:
         print(msg)
     exit(1)            
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) < 2 or len(sys.argv) > 3:
         usage()
     if len(sys.argv) == 2:
@@ -46,6 +48,8 @@ if __name__ == '__main__':
     else:
         Players_data = sys.argv[1]
         Artefact = sys.argv[2]
+    if data.find_artefact(Artefact) is None:
+        usage('Unknown artefact {}'.format(Artefact))
     Units = data.load_default_programs()
     Unique_programs = {}
     Unique_programs_with_names = {}
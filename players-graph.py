@@ -29,7 +29,7 @@ import data
 BLACKLIST_PLAYERS_FILE = 'blacklist.txt'
 
 def usage():
-    print('usage: {} <database1.csv> [<database2.csv> ...]'.format(sys.argv[0]))
+    print('usage: {} [--no-cache] [--mmap] [--workers N] <database1.csv> [<database2.csv> ...]'.format(sys.argv[0]))
     exit(1)
 
 def calc_statistics(players, stats):
@@ -65,6 +65,8 @@ def print_histogram(hist, year):
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     players_data = []
     for i, arg in enumerate(sys.argv):
         if i == 0: continue
@@ -78,9 +80,8 @@ if __name__ == '__main__':
         _blacklist_filter = data.load_players_list(BLACKLIST_PLAYERS_FILE)
 
     stats = {}
-    for p in players_data:
-        players = data.read_players_data(p, None, _blacklist_filter)
-        calc_statistics(players, stats)
+    players = data.read_players_sources(players_data, None, _blacklist_filter)
+    calc_statistics(players, stats)
 
     hist = calc_histogram(stats)
         
@@ -32,7 +32,7 @@ STANDARD_PATH_NEW  = os.path.join('standard_programs', '1.6')
 STANDARD_UNITS     = ('Autoborder', 'Stapler')
 
 def usage():
-    print('usage: {} <database1.csv> [<database2.csv> ...]'.format(sys.argv[0]))
+    print('usage: {} [--no-cache] [--mmap] [--workers N] <database1.csv> [<database2.csv> ...]'.format(sys.argv[0]))
     exit(1)
 
 def check_program(art, unit, progs, su):
@@ -66,6 +66,8 @@ def calc_statistics(players, stats, su, su16):
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     players_data = []
     for i, arg in enumerate(sys.argv):
         if i == 0: continue
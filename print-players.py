@@ -28,7 +28,7 @@ import data
 NEW_VERSIONS = ('1.6', '1.7')
 
 def usage():
-    print('usage: {} <database.csv> <players-indexes-filter.txt> <output.csv>'.format(sys.argv[0]))
+    print('usage: {} [--no-cache] [--mmap] [--workers N] <database.csv> <players-indexes-filter.txt> <output.csv>'.format(sys.argv[0]))
     exit(1)
 
 def save_csv(fname, data):
@@ -92,6 +92,8 @@ def add_zeros(data, player, session_id):
         
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) != 4:
         usage()
     
@@ -105,6 +107,9 @@ if __name__ == '__main__':
     output_file = sys.argv[3]
     
     Data = []
+
+    data.load_players_programs([player for player, values in Players.items() if len(values[2]) > 0],
+                               Programs, Unique_programs, Unique_programs_with_names)
     
     for player, values in Players.items():        
         
@@ -126,8 +131,6 @@ if __name__ == '__main__':
         Player_level = 0
         Player_uniq_programs = set([])
 
-        data.load_player_programs(player, Programs, Unique_programs, Unique_programs_with_names)
-
         Waves_n = 0
         Tries_n = 0
         Max_Level = 0
@@ -31,13 +31,15 @@ import datetime
 NEW_VERSIONS = ('1.6', '1.7')
 
 def usage(msg = ''):
-    print("Usage: {} <database-path> <player-id|player-id-with-comma-separated-indexes> [index-from index-to]".format(sys.argv[0]))
+    print("Usage: {} [--no-cache] [--mmap] [--workers N] <database-path> <player-id|player-id-with-comma-separated-indexes> [index-from index-to]".format(sys.argv[0]))
     if msg:
         print(msg)
     exit(1)            
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) != 3 and len(sys.argv) != 5:
         usage()
 
@@ -31,13 +31,15 @@ import datetime
 DEFAULT_PLAYERS_DATA = 'test.csv'
 
 def usage(msg = ''):
-    print("Usage: {} [database-path] <player-id> [<start-index> <finish-index>]".format(sys.argv[0]))
+    print("Usage: {} [--no-cache] [--mmap] [--workers N] [--sqlite] [database-path] <player-id> [<start-index> <finish-index>]".format(sys.argv[0]))
     if msg:
         print(msg)
     exit(1)            
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) < 2 or len(sys.argv) > 5:
         usage()
         
@@ -54,7 +56,13 @@ if __name__ == '__main__':
         start_index = int(sys.argv[3])
         finish_index = int(sys.argv[4])
 
-    if start_index is None:
+    if data.USE_SQLITE and start_index is None:
+        # the player's sessions are read from the SQLite copy of the data
+        Db = data.sessions_database(Players_data)
+        print(Player.lower(), ':')
+        for s in data.query_sessions(Db, player=Player.lower()):
+            data.print_session(s)
+    elif start_index is None:
         data.read_players_sessions(Players_data, {Player.lower(): None}, True)
     else:
         data.read_players_sessions(Players_data, {Player.lower(): [(start_index, finish_index)]}, True)
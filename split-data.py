@@ -21,17 +21,110 @@
 #  ----------------------------------------------------------------------------- 
 
 import sys
+import os
+import mmap
+import json
 
 import data
 
+SHARDS_OPTION = '--shards'
+COMPRESS_OPTION = '--compress'
+
 def usage(msg = ''):
     print("Usage: {} <database-path> [<more-database-paths> ...] <player-id-list>".format(sys.argv[0]))
+    print("       {} {} N [{} gz|xz|zst] <shard-dir> <database-path> [<more-database-paths> ...]".format(
+        sys.argv[0], SHARDS_OPTION, COMPRESS_OPTION))
     if msg:
         print(msg)
     exit(1)            
 
+SEPARATOR = data.CSV_DELIMITER.encode('utf-8')
+HEADER = b'id' + SEPARATOR
+
+def data_lines(datafile):
+    # the rows of the export as the raw lines
+    if data.is_compressed(datafile):
+        with data.open_data_file(datafile) as f:
+            lines = (line.encode('utf-8') for line in f)
+            yield from row_lines(lines)
+        return
+    if os.path.getsize(datafile) == 0:
+        return
+    with open(datafile, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from row_lines(iter(mm.readline, b''))
+
+def row_lines(lines):
+    # the lines of a quoted field with line breaks are joined into one row;
+    # the last line of an export may have no newline, it is added so the
+    # lines of the next export are not glued to it
+    quote = ord('"')
+    for line in lines:
+        if quote in line:
+            while line.count(b'"') % 2 == 1:
+                more = next(lines, None)
+                if more is None:
+                    break
+                line += more
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        yield line
+
+def line_player(line):
+    return data.line_player(line, SEPARATOR, data.CSV_DELIMITER)
+
+def write_shards(datafiles, shard_dir, count, suffix):
+    # streams the exports once writing every line into the shard of its
+    # player, each shard starts with the header of the first export
+    if not os.path.isdir(shard_dir):
+        os.makedirs(shard_dir)
+    names = ['shard-{:03}.csv{}'.format(k, suffix) for k in range(count)]
+    shards = [data.create_data_file(os.path.join(shard_dir, name)) for name in names]
+    rows = [0] * count
+    players = {}
+    header = None
+    for datafile in datafiles:
+        for line in data_lines(datafile):
+            if line.startswith(HEADER):
+                if header is None:
+                    header = line
+                    for shard in shards:
+                        shard.write(header)
+                continue
+            player = line_player(line)
+            if player not in players:
+                players[player] = data.player_shard(player.decode('utf-8'), count)
+            k = players[player]
+            shards[k].write(line)
+            rows[k] += 1
+    for shard in shards:
+        shard.close()
+    with open(os.path.join(shard_dir, data.SHARD_MANIFEST), 'w') as f:
+        json.dump({'shards': count, 'files': names, 'rows': rows,
+                   'sources': [os.path.abspath(datafile) for datafile in datafiles]}, f, indent=1)
+    print('{} players written into {} shards'.format(len(players), count))
+
 if __name__ == '__main__':
 
+    if SHARDS_OPTION in sys.argv:
+        idx = sys.argv.index(SHARDS_OPTION)
+        if idx + 1 >= len(sys.argv) or not sys.argv[idx + 1].isdigit() or int(sys.argv[idx + 1]) < 1:
+            usage('Bad {} value: the number of shards expected'.format(SHARDS_OPTION))
+        count = int(sys.argv[idx + 1])
+        del sys.argv[idx:idx + 2]
+        suffix = ''
+        if COMPRESS_OPTION in sys.argv:
+            idx = sys.argv.index(COMPRESS_OPTION)
+            if idx + 1 >= len(sys.argv) or '.' + sys.argv[idx + 1] not in data.COMPRESSED_SUFFIXES:
+                usage('Bad {} value: gz, xz or zst expected'.format(COMPRESS_OPTION))
+            suffix = '.' + sys.argv[idx + 1]
+            del sys.argv[idx:idx + 2]
+            if suffix == '.zst' and data.zstandard is None:
+                usage('The zstandard module is required for zst shards')
+        if len(sys.argv) < 3:
+            usage()
+        write_shards(sys.argv[2:], sys.argv[1], count, suffix)
+        exit(0)
+
     if len(sys.argv) < 3:
         usage()
 
@@ -44,15 +137,15 @@ if __name__ == '__main__':
 
     PLAYERS = data.load_players_index_list(playersfile)
     Players_found = set([])
+    Players_bytes = {p.encode('utf-8'): p for p in PLAYERS}
 
+    # scan the exports comparing the raw player column bytes
     for datafile in datafiles:
-        with open(datafile) as f:
-            for line in f.readlines():
-                parts = line.split(',')
-                player = parts[data._CSV_PLAYER]
-                if player in PLAYERS:
-                    Players_found.add(player)
-                    print(line, end='')
+        for line in data_lines(datafile):
+            player = line_player(line)
+            if player in Players_bytes:
+                Players_found.add(Players_bytes[player])
+                sys.stdout.buffer.write(line)
 
     # players not found
     for p in PLAYERS:
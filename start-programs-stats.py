@@ -66,6 +66,8 @@ def print_programs(player, programs):
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) < 2:
         Players_data = DEFAULT_PLAYERS_DATA
     else:
@@ -91,9 +93,10 @@ if __name__ == '__main__':
     Programs_with_standards = {}
     Players_found = set([])
 
+    data.load_players_programs(Players.keys(), Programs, Unique_programs, Unique_programs_with_names)
+
     for player, values in Players.items():        
         _, _, sessions = values
-        data.load_player_programs(player, Programs, Unique_programs, Unique_programs_with_names)
         player_programs = {}
         for u in data.UNITS:
             player_programs[u] = []
@@ -39,7 +39,7 @@ MIN_PROGRAMM_UNITS =   1             # at least one program
 MAX_PROGRAMM_UNITS =   100            # no more than 50 programmed units
 
 def usage():
-    print('usage: {} <database1.csv> [database2.csv ...]'.format(sys.argv[0]))
+    print('usage: {} [--no-cache] [--mmap] [--workers N] <database1.csv> [database2.csv ...]'.format(sys.argv[0]))
     exit(1)
 
 def filter_players(players, start_players):
@@ -72,6 +72,8 @@ def filter_players(players, start_players):
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     players_data = []
     for i, arg in enumerate(sys.argv):
         if i == 0: continue
@@ -27,8 +27,10 @@ import csv
 import data
 import datetime
 
+data.parse_data_options(sys.argv)
+
 if len(sys.argv) < 2 or len(sys.argv) > 3:
-    print('usage: {} <database.csv> [players-indexes-filter.txt]'.format(sys.argv[0]))
+    print('usage: {} [--no-cache] [--mmap] [--workers N] <database.csv> [players-indexes-filter.txt]'.format(sys.argv[0]))
     exit(1)
 else: 
     PLAYERS_DATA = sys.argv[1]
@@ -125,6 +127,10 @@ if __name__ == '__main__':
     Players_with_debugging = set([])
     Super_Max_Level_Wave = None
     Super_Max_Level_Wave_Player = None
+
+    data.load_players_programs([player for player, values in Players.items()
+                                if (Blacklist_filter is None or player not in Blacklist_filter) and len(values[2]) > 0],
+                               Programs, Unique_programs, Unique_programs_with_names)
     
     for player, values in Players.items():        
 
@@ -148,10 +154,6 @@ if __name__ == '__main__':
         Player_level_prog = 0
         Player_uniq_programs = set([])
 
-        #print("Load player's {} programs... ".format(player), end='')
-        data.load_player_programs(player, Programs, Unique_programs, Unique_programs_with_names)
-        #print('done')
-        
         challenge = False
         first_program_level = 5
         first_program_wave = 16
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+# -----------------------------------------------------------------------------
+#  The Berloga Apiary Defence statistics analysis tool
+#
+#  The data module tests
+#
+#  Copyright (C) 2025 Alexey Fedoseev <aleksey@fedoseev.net>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see https://www.gnu.org/licenses/
+#  -----------------------------------------------------------------------------
+
+import random
+import unittest
+
+import data
+
+def make_players(cindexes):
+    players = {}
+    for pl, indexes in cindexes.items():
+        activities = {}
+        for k, c in enumerate(indexes):
+            a = data.Activity('1.6', k, float(k), '', None)
+            a.c = c
+            activities['{}-{}'.format(pl, k)] = a
+        players[pl] = (activities, [], [])
+    return players
+
+def split_players_linear(players, player_filter):
+    # the multi-players split by the linear scan of every range
+    to_delete = set([])
+    to_add = {}
+    for pl, pl_values in players.items():
+        if player_filter[pl] is None:
+            continue
+        for indexes in player_filter[pl]:
+            if indexes is None: continue
+            first_index, last_index = indexes
+            activities, _, _ = pl_values
+            for aid, a in activities.items():
+                if first_index <= a.c <= last_index:
+                    new_player = data.pack_player(pl, first_index)
+                    to_delete.add(pl)
+                    if new_player not in to_add:
+                        to_add[new_player] = {}
+                    to_add[new_player][aid] = a
+    for p in to_delete:
+        del players[p]
+    for p, v in to_add.items():
+        players[p] = (v, [], [])
+
+def players_layout(players):
+    return [(pl, list(values[0].keys())) for pl, values in players.items()]
+
+class SplitPlayersTest(unittest.TestCase):
+
+    def check(self, cindexes, player_filter):
+        expected = make_players(cindexes)
+        split_players_linear(expected, player_filter)
+        players = make_players(cindexes)
+        data.build_players(players, player_filter)
+        self.assertEqual(players_layout(players), players_layout(expected))
+
+    def test_disjoint_ranges(self):
+        self.check({'a': [1, 2, 3, 10, 11, 20]}, {'a': [(1, 3), (10, 11)]})
+
+    def test_overlapping_ranges(self):
+        self.check({'a': [1, 2, 3, 4, 5, 6, 7]}, {'a': [(1, 5), (3, 7), (4, 4)]})
+
+    def test_repeated_first_indexes(self):
+        self.check({'a': [1, 2, 3, 4, 5, 6]}, {'a': [(2, 3), (2, 5), (2, 2)]})
+
+    def test_open_ranges(self):
+        self.check({'a': [1, 2, 3], 'b': [5, 6], 'c': [7]},
+                   {'a': [None, (2, 3)], 'b': None, 'c': [None]})
+
+    def test_out_of_order_indexes(self):
+        self.check({'a': [9, 1, 7, 3, 3, 5, 0, 8]}, {'a': [(6, 9), (0, 3), (3, 3)]})
+
+    def test_empty_ranges(self):
+        self.check({'a': [1, 2, 3], 'b': [4]}, {'a': [(5, 9), (0, 0)], 'b': [(4, 4)]})
+
+    def test_random(self):
+        rnd = random.Random(1)
+        for _ in range(200):
+            cindexes = {}
+            player_filter = {}
+            for n in range(rnd.randint(1, 4)):
+                pl = 'p{}'.format(n)
+                cindexes[pl] = [rnd.randint(0, 30) for _ in range(rnd.randint(0, 40))]
+                if rnd.random() < 0.1:
+                    player_filter[pl] = None
+                    continue
+                ranges = []
+                for _ in range(rnd.randint(1, 5)):
+                    if rnd.random() < 0.1:
+                        ranges.append(None)
+                        continue
+                    first = rnd.randint(0, 30)
+                    ranges.append((first, first + rnd.randint(0, 12)))
+                player_filter[pl] = ranges
+            self.check(cindexes, player_filter)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,7 +26,7 @@ import csv
 import data
 
 def usage():
-    print('usage: {} <database.csv> <players-output.csv> <actions-output.csv>'.format(sys.argv[0]))
+    print('usage: {} [--no-cache] [--mmap] [--workers N] [--sqlite] [--columnar] <database.csv> <players-output.csv> <actions-output.csv>'.format(sys.argv[0]))
     exit(1)
 
 def save_csv(fname, data):
@@ -37,10 +37,15 @@ def save_csv(fname, data):
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) != 4:
         usage()
     
-    players_stats, actions_stats = data.read_time_statistics(sys.argv[1])
+    if data.USE_SQLITE:
+        players_stats, actions_stats = data.query_time_statistics(data.sessions_database(sys.argv[1]))
+    else:
+        players_stats, actions_stats = data.read_time_statistics(sys.argv[1], None, data.COLUMNAR_STORE)
     pl_output_file = sys.argv[2]
     a_output_file = sys.argv[3]
 
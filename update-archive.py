@@ -29,11 +29,39 @@ import data
 FILTER_PLAYERS_FILE = None #'select_players.txt'
 FILTER_PLAYERS = None # ['player-id-1', 'player-id-2']
 ARTEFACT_URL = 'https://storage.yandexcloud.net/berloga-artefacts/{}/{}.xml'
+REBUILD_INDEX_OPTION = '--rebuild-index'
+PACK_OPTION = '--pack'
 
 Hashes = {}
 
+def archive_artefact(player_id, artefact_id, checksum):
+    if data.archived_player(artefact_id) is not None:
+        if checksum not in Hashes:
+            Hashes[checksum] = (player_id, artefact_id)
+        return
+    if checksum in Hashes:
+        _, old_artefact_id = Hashes[checksum]
+        if data.archive_artefact_link(player_id, artefact_id, old_artefact_id):
+            print('link {} -> {}'.format(old_artefact_id, artefact_id))
+            return
+    path = ARTEFACT_URL.format(player_id, artefact_id)
+    print('downloading {}...'.format(path), end='')
+    try:
+        artefact = urllib.request.urlopen(path)
+        data.archive_program(player_id, artefact_id, artefact.read())
+        print(' done')
+    except urllib.error.HTTPError:
+        print(' FAILED!')
+        return
+    Hashes[checksum] = (player_id, artefact_id)
+
 def download_artefact(player_id, artefact):
 
+    if data.use_programs_archive():
+        artefact_id, checksum, _, _, _ = artefact
+        archive_artefact(player_id, artefact_id, checksum)
+        return
+
     if not os.path.isdir(data.PROGRAMS_DIR):
         os.mkdir(data.PROGRAMS_DIR)
     player_dir = os.path.join(data.PROGRAMS_DIR, player_id)
@@ -55,6 +83,8 @@ def download_artefact(player_id, artefact):
                 print(' done')
             except urllib.error.HTTPError:
                 print(' FAILED!')
+                return
+        data.add_artefact(player_id, artefact_id)
     else:
         old_player_id, old_artefact_id = Hashes[checksum]
         link_from = os.path.abspath(data.get_artefact_file(old_player_id, old_artefact_id))
@@ -62,8 +92,20 @@ def download_artefact(player_id, artefact):
         if os.path.isfile(link_from) and not os.path.islink(link_to) and not os.path.isfile(link_to):
             print('link {} -> {}'.format(link_from, link_to))
             os.symlink(link_from, link_to)
+        if os.path.isfile(link_to):
+            data.add_artefact(player_id, artefact_id)
 
 if __name__ == '__main__':
+    data.parse_data_options(sys.argv)
+
+    if REBUILD_INDEX_OPTION in sys.argv:
+        sys.argv.remove(REBUILD_INDEX_OPTION)
+        data.rebuild_artefact_index()
+
+    if PACK_OPTION in sys.argv:
+        sys.argv.remove(PACK_OPTION)
+        data.pack_programs_archive()
+
     if FILTER_PLAYERS_FILE:
         with open(FILTER_PLAYERS_FILE) as f:
             Players_filter = set(f.read().splitlines())
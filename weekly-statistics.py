@@ -44,7 +44,7 @@ PLATFORMS = {'pl_a': 'Android',
              'pl_l': 'Linux'}
 
 def usage():
-    print('usage: {} <database1.csv> [database2.csv ...] [-o output.html]'.format(sys.argv[0]))
+    print('usage: {} [--no-cache] [--mmap] [--workers N] [--columnar] <database1.csv> [database2.csv ...] [-o output.html]'.format(sys.argv[0]))
     exit(1)
 
 def calc_statistics(players, sheets):
@@ -397,6 +397,8 @@ def save_statistics_to_html(sheets, filename):
 
 if __name__ == '__main__':
 
+    data.parse_data_options(sys.argv)
+
     if len(sys.argv) < 2:
         usage()
         
@@ -425,8 +427,12 @@ if __name__ == '__main__':
         _blacklist_filter = data.load_players_list(BLACKLIST_PLAYERS_FILE)
 
     sheets = {}
-    for p in player_files:
-        players = data.read_players_data(p, None, _blacklist_filter)
+    if data.COLUMNAR_STORE:
+        for p in player_files:
+            players = data.read_players_columns(p, None, _blacklist_filter)
+            calc_statistics(players, sheets)
+    else:
+        players = data.read_players_sources(player_files, None, _blacklist_filter)
         calc_statistics(players, sheets)
 
     if not output_html: